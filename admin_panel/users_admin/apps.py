@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class UsersAdminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users_admin'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,27 @@
+import functools
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from redis import Redis
+
+from config_data.config import get_config
+from db.user_cache_keys import queue_invalidation
+from .models import Users
+
+
+@functools.cache
+def _redis() -> Redis:
+    # Обычный клиент: db.user_cache тянет за собой движок бота и метрики, админке они не нужны
+    redis = get_config().redis
+    return Redis(host=redis.host, port=redis.port, password=redis.password, db=redis.db)
+
+
+@receiver(post_save, sender=Users)
+@receiver(post_delete, sender=Users)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """
+    Изменения пользователя из админки сразу сбрасывают кэш профиля в боте.
+    """
+    pipe = _redis().pipeline()
+    queue_invalidation(pipe, [instance.user_id])
+    pipe.execute()
@@ -0,0 +1,184 @@
+"""
+Память AlbumMiddleware: прогоняет тысячи медиагрупп и проверяет, что буфер альбомов
+опустел, обработчик вызван ровно по разу на группу, а прирост памяти не зависит от числа групп.
+Отдельно проверяются срабатывание по ttl и вытеснение при max_albums: после них в буфере
+не остаётся групп, а в цикле событий — живых таймеров. Код выхода 1 — регрессия.
+
+    uv run python -m benchmarks.bench_album_middleware --albums 5000
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import random
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+from middlewares.album_middleware import AlbumMiddleware
+
+
+def make_album(group: int, first_id: int, size: int) -> list:
+    # Мидлварь читает у сообщения только media_group_id и message_id
+    return [SimpleNamespace(media_group_id=f"g{group}", message_id=first_id + i) for i in range(size)]
+
+
+async def push(middleware: AlbumMiddleware, albums: int, concurrency: int) -> list:
+    calls = []
+
+    async def handler(event, data):
+        calls.append(len(data["album"]))
+
+    message_id = 0
+    for start in range(0, albums, concurrency):
+        # Сообщения нескольких альбомов приходят вперемешку и не по порядку
+        messages = []
+        for group in range(start, min(start + concurrency, albums)):
+            size = random.randint(2, 10)
+            messages += make_album(group, message_id, size)
+            message_id += size
+        random.shuffle(messages)
+        await asyncio.gather(*(middleware(handler, msg, {}) for msg in messages))
+
+    # Ждём последние таймеры и запущенные обработчики
+    await drain(middleware)
+    return calls
+
+
+class TimerTracker:
+    """
+    Запоминает таймеры, которые мидлварь ставит через loop.call_later, и считает ещё живые.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.handles = []
+        self.call_later = self.loop.call_later
+        self.loop.call_later = self._call_later
+
+    def _call_later(self, delay, callback, *args, **kwargs):
+        handle = self.call_later(delay, callback, *args, **kwargs)
+        self.handles.append(handle)
+        return handle
+
+    def alive(self) -> int:
+        now = self.loop.time()
+        return sum(1 for handle in self.handles if not handle.cancelled() and handle.when() > now)
+
+    def close(self):
+        del self.loop.call_later
+
+
+async def drain(middleware: AlbumMiddleware):
+    await asyncio.sleep(middleware.latency * 2)
+    while middleware.tasks:
+        await asyncio.gather(*middleware.tasks)
+
+
+async def check_ttl() -> list[str]:
+    """
+    Сообщения группы приходят чаще latency: таймер всё время переносится,
+    и альбом должен уйти по ttl, не дожидаясь тишины.
+    """
+    middleware = AlbumMiddleware(latency=0.1, ttl=0.2)
+    tracker = TimerTracker()
+    calls = []
+
+    async def handler(event, data):
+        calls.append(len(data["album"]))
+
+    try:
+        # Шестое сообщение приходит на 0.225 с — позже ttl, но раньше таймера latency
+        for i, message in enumerate(make_album(0, 0, 6)):
+            if i:
+                await asyncio.sleep(0.045)
+            await middleware(handler, message, {})
+        fired_by_ttl = not middleware.album_data
+        await drain(middleware)
+        alive = tracker.alive()
+    finally:
+        tracker.close()
+
+    errors = []
+    if not fired_by_ttl:
+        errors.append("альбом не отправлен по ttl")
+    if len(calls) != 1:
+        errors.append(f"ttl: обработчик вызван {len(calls)} раз вместо 1")
+    if middleware.album_data or alive:
+        errors.append(f"ttl: в буфере {len(middleware.album_data)} групп, живых таймеров {alive}")
+    return errors
+
+
+async def check_eviction(groups: int = 50, max_albums: int = 10) -> list[str]:
+    """
+    Больше групп, чем max_albums: старые вытесняются вместе с таймерами.
+    """
+    middleware = AlbumMiddleware(latency=0.05, max_albums=max_albums)
+    # Предупреждения о каждой вытесненной группе здесь ожидаемы
+    logging.getLogger("middlewares.album_middleware").setLevel(logging.ERROR)
+    tracker = TimerTracker()
+    calls = []
+
+    async def handler(event, data):
+        calls.append(len(data["album"]))
+
+    try:
+        peak = 0
+        for group in range(groups):
+            for message in make_album(group, group * 2, 2):
+                await middleware(handler, message, {})
+            peak = max(peak, len(middleware.album_data))
+        alive_before = tracker.alive()
+        await drain(middleware)
+        alive = tracker.alive()
+    finally:
+        tracker.close()
+
+    errors = []
+    if peak > max_albums:
+        errors.append(f"вытеснение: в буфере было {peak} групп при max_albums={max_albums}")
+    if alive_before > max_albums:
+        errors.append(f"вытеснение: живых таймеров {alive_before} при max_albums={max_albums}")
+    if len(calls) != max_albums:
+        errors.append(f"вытеснение: обработчик вызван {len(calls)} раз вместо {max_albums}")
+    if middleware.album_data or alive:
+        errors.append(f"вытеснение: в буфере {len(middleware.album_data)} групп, живых таймеров {alive}")
+    return errors
+
+
+async def main(albums: int, concurrency: int) -> int:
+    errors = await check_ttl() + await check_eviction()
+    for error in errors:
+        print(f"✗ {error}")
+
+    middleware = AlbumMiddleware(latency=0.05)
+    # Прогрев, чтобы в замер не попали разовые аллокации asyncio
+    await push(middleware, concurrency, concurrency)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    calls = await push(middleware, albums, concurrency)
+    peak = tracemalloc.get_traced_memory()[1]
+    handled = len(calls)
+    del calls
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"альбомов: {albums}, вызовов обработчика: {handled}")
+    print(f"в буфере осталось: {len(middleware.album_data)}, задач: {len(middleware.tasks)}")
+    print(f"пик памяти: {peak / 1024:.0f} KiB, осталось после прогона: {retained / 1024:.0f} KiB")
+
+    ok = not errors and handled == albums and not middleware.album_data and not middleware.tasks
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--albums", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.albums, args.concurrency)))
@@ -0,0 +1,125 @@
+"""
+Микробенчмарк горячих запросов db/ORM.py: старый путь (SELECT объекта + изменение + COMMIT)
+против одиночных insert ... on conflict / update ... returning / delete ... returning.
+
+Запуск против локального Postgres (переменные окружения как у бота, миграции применены):
+
+    uv run python -m benchmarks.bench_orm --iterations 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select
+
+from db import user_cache
+from db.ORM import DataBase, SenderORM
+from db.database import async_engine, session_factory_async
+from db.models import Users
+
+# ID заведомо вне диапазона Telegram, чтобы не задеть реальных пользователей
+BASE_ID = 9_000_000_000_000
+
+
+async def _noop_invalidate(user_id):
+    pass
+
+
+async def old_insert_user(user_id, user_name):
+    async with session_factory_async() as session:
+        user = (await session.execute(select(Users).filter(Users.user_id == user_id))).scalar_one_or_none()
+        if user:
+            return False
+        session.add(Users(user_id=user_id, user_name=user_name))
+        await session.commit()
+        return True
+
+
+async def old_update_user_status(user_id, new_status):
+    async with session_factory_async() as session:
+        user = (await session.execute(select(Users).filter(Users.user_id == user_id))).scalar_one_or_none()
+        if not user:
+            return False
+        user.status = new_status
+        await session.commit()
+        return True
+
+
+async def old_increment_sent_links(user_id):
+    async with session_factory_async() as session:
+        user = (await session.execute(select(Users).filter(Users.user_id == user_id))).scalar_one_or_none()
+        if not user:
+            return False
+        user.sent_links = (user.sent_links or 0) + 1
+        await session.commit()
+        return True
+
+
+async def old_delete_user(user_id):
+    async with session_factory_async() as session:
+        user = (await session.execute(select(Users).filter(Users.user_id == user_id))).scalar_one_or_none()
+        if not user:
+            return False
+        await session.delete(user)
+        await session.commit()
+        return True
+
+
+OLD = {
+    "insert_user": lambda uid: old_insert_user(uid, "bench"),
+    "update_user_status": lambda uid: old_update_user_status(uid, "blocked"),
+    "increment_sent_links": old_increment_sent_links,
+    "delete_user": old_delete_user,
+}
+
+NEW = {
+    "insert_user": lambda uid: DataBase.insert_user(uid, "bench"),
+    "update_user_status": lambda uid: SenderORM.update_user_status(uid, "blocked"),
+    "increment_sent_links": DataBase.increment_sent_links,
+    "delete_user": DataBase.delete_user,
+}
+
+
+async def run_path(path: dict, iterations: int, offset: int) -> dict:
+    timings = {name: [] for name in path}
+    for i in range(iterations):
+        user_id = BASE_ID + offset + i
+        # Порядок важен: вставка, два обновления, удаление — так таблица остаётся чистой
+        for name, op in path.items():
+            started = time.perf_counter()
+            await op(user_id)
+            timings[name].append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label: str, timings: dict):
+    print(f"\n{label}")
+    for name, samples in timings.items():
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        print(f"  {name:<22} mean {statistics.mean(samples):7.3f} ms   p50 {statistics.median(samples):7.3f} ms"
+              f"   p95 {p95:7.3f} ms")
+
+
+async def main(iterations: int, warmup: int):
+    # Меряем только Postgres: сброс кэша профилей в Redis здесь не нужен
+    user_cache.invalidate = _noop_invalidate
+
+    await run_path(OLD, warmup, 0)
+    await run_path(NEW, warmup, warmup)
+
+    old = await run_path(OLD, iterations, 2 * warmup)
+    new = await run_path(NEW, iterations, 2 * warmup + iterations)
+    report("old (select + mutate + commit)", old)
+    report("new (single statement)", new)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.warmup))
@@ -0,0 +1,104 @@
+"""
+CPU на одного получателя рассылки: старая отправка (MediaGroupBuilder и цепочка if на каждого)
+против заранее собранного SendPlan и копирования исходного сообщения.
+
+Сеть не используется: сессия бота сериализует запрос как настоящая и сразу возвращается.
+
+    uv run python -m benchmarks.bench_send_plan --recipients 20000
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.utils.media_group import MediaGroupBuilder
+
+from sender.send_plan import compile_send_plan
+
+ADMIN_CHAT_ID = 1000
+FILE_ID = "AgACAgIAAxkBAAIBQmZbench" + "x" * 40
+
+PAYLOADS = {
+    "text": {"type": "send_all", "text": "Новости бота " * 20},
+    "photo": {"type": "send_all", "photo": FILE_ID, "caption": "Подпись к фото"},
+    "album x5": {
+        "type": "send_all",
+        "media_messages": [
+            {"type": "photo", "file_id": f"{FILE_ID}{i}", "caption": "Альбом" if i == 0 else None}
+            for i in range(5)
+        ],
+    },
+}
+
+SOURCES = {
+    "text": {"chat_id": ADMIN_CHAT_ID, "message_ids": [1]},
+    "photo": {"chat_id": ADMIN_CHAT_ID, "message_ids": [2]},
+    "album x5": {"chat_id": ADMIN_CHAT_ID, "message_ids": [3, 4, 5, 6, 7]},
+}
+
+
+class OfflineSession(AiohttpSession):
+    async def make_request(self, bot, method, timeout=None):
+        # Та же сериализация, что перед отправкой в Telegram
+        self.build_form_data(bot, method)
+        return None
+
+
+async def old_send_mailing_message(bot: Bot, user_id: int, mailing_data: dict):
+    if 'media_messages' in mailing_data:
+        media_group = MediaGroupBuilder(caption=mailing_data['media_messages'][0].get('caption'))
+        for media in mailing_data['media_messages']:
+            media_group.add(
+                type=media['type'],
+                media=media['file_id']
+            )
+        await bot.send_media_group(user_id, media=media_group.build())
+    elif mailing_data.get('photo'):
+        await bot.send_photo(user_id, mailing_data['photo'], caption=mailing_data.get('caption'))
+    elif mailing_data.get('video'):
+        await bot.send_video(user_id, mailing_data['video'], caption=mailing_data.get('caption'))
+    elif mailing_data.get('document'):
+        await bot.send_document(user_id, mailing_data['document'], caption=mailing_data.get('caption'))
+    elif mailing_data.get('audio'):
+        await bot.send_audio(user_id, mailing_data['audio'], caption=mailing_data.get('caption'))
+    elif mailing_data.get('voice'):
+        await bot.send_voice(user_id, mailing_data['voice'], caption=mailing_data.get('caption'))
+    elif mailing_data.get('text'):
+        await bot.send_message(user_id, mailing_data['text'])
+
+
+async def measure(send, recipients: int) -> float:
+    """
+    Процессорное время на получателя, мкс.
+    """
+    started = time.process_time()
+    for user_id in range(1, recipients + 1):
+        await send(user_id)
+    return (time.process_time() - started) / recipients * 1e6
+
+
+async def main(recipients: int):
+    bot = Bot("123456:bench", session=OfflineSession())
+    print(f"{'payload':<10} {'old':>10} {'plan':>10} {'copy':>10}   (мкс CPU на получателя)")
+    for name, payload in PAYLOADS.items():
+        plan = compile_send_plan(payload)
+        copy_plan = compile_send_plan({**payload, "source": SOURCES[name]})
+        paths = {
+            "old": lambda uid: old_send_mailing_message(bot, uid, payload),
+            "plan": lambda uid: plan.send(bot, uid),
+            "copy": lambda uid: copy_plan.send(bot, uid),
+        }
+        results = {}
+        for label, send in paths.items():
+            await measure(send, recipients // 10)
+            results[label] = await measure(send, recipients)
+        print(f"{name:<10} {results['old']:>10.1f} {results['plan']:>10.1f} {results['copy']:>10.1f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.recipients))
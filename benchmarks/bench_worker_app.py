@@ -0,0 +1,29 @@
+"""
+Celery-приложение для benchmarks.bench_workers: настоящие задачи celery_app.tasks,
+yt-dlp (и заглушка в подпроцессе потоковой загрузки) читает синтетическое медиа
+с локального MediaServer, S3 — в памяти процесса.
+Параметры приходят через переменные окружения BENCH_*.
+"""
+import os
+
+# Данные задач (стримы результатов, кэши, индексы S3) — в базе прогона, а не в рабочей:
+# иначе записи фейковых пользователей попадут в consumer group живого бота
+_redis_db = os.environ.get("BENCH_REDIS_DB", "15")
+os.environ["REDIS_DB"] = _redis_db
+
+from benchmarks import fakes
+from celery_app.tasks import app
+from config_data.config import get_config
+
+fakes.install(
+    size=int(os.environ.get("BENCH_MEDIA_SIZE", 8 * 1024 * 1024)),
+    probe_delay=float(os.environ.get("BENCH_PROBE_DELAY", 0)),
+    media_url=os.environ.get("BENCH_MEDIA_URL"),
+    stream=os.environ.get("BENCH_STREAM", "1") == "1",
+)
+
+# Брокер тоже в базе прогона, чтобы не смешивать очереди прогона с рабочими
+_redis = get_config().redis
+_redis_url = f"redis://:{_redis.password}@{_redis.host}:{_redis.port}/{_redis_db}"
+app.conf.broker_url = _redis_url
+app.conf.result_backend = _redis_url
@@ -0,0 +1,227 @@
+"""
+Пропускная способность Celery-воркера в зависимости от пула, concurrency и prefetch.
+
+Для каждой комбинации поднимается отдельный воркер (benchmarks.bench_worker_app),
+в очереди кладутся download_and_upload_video и parse_youtube_formats по уникальным
+видео, медиа отдаёт локальный HTTP-сервер. Скачивание идёт потоком в S3 через заглушку
+yt-dlp в подпроцессе (--no-stream — через временный файл). Печатается jobs/min, байт/с, CPU
+и пик RSS воркера вместе с дочерними процессами (по /proc). Нужен локальный Redis; брокер и данные задач
+прогона живут в отдельной базе (--redis-db). Пул gevent пропускается, если gevent не установлен.
+
+    uv run python -m benchmarks.bench_workers --pools prefork,threads --concurrency 2,4,8 --prefetch 1,4
+"""
+import argparse
+import importlib.util
+import itertools
+import os
+import random
+import signal
+import string
+import subprocess
+import sys
+import threading
+import time
+
+from celery.result import ResultSet
+
+from benchmarks import fakes
+from config_data.config import get_config
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _process_tree(pid: int) -> list[int]:
+    """
+    pid и все его потомки по /proc/<pid>/stat.
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Имя процесса в скобках может содержать пробелы — режем по последней скобке
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError):
+            continue
+
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(parents.get(current, ()))
+    return tree
+
+
+def _cpu_and_rss(pids: list[int]) -> tuple[float, int]:
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime и stime — 12-е и 13-е поля после имени процесса
+            cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError):
+            continue
+    return cpu, rss
+
+
+class ResourceSampler:
+    """
+    Раз в interval секунд снимает CPU и RSS дерева процессов воркера.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        cpu, rss = _cpu_and_rss(_process_tree(self.pid))
+        self.cpu = max(self.cpu, cpu)
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "ResourceSampler":
+        self._sample()
+        self.cpu_before = self.cpu
+        self.thread.start()
+        return self
+
+    def stop(self) -> tuple[float, int]:
+        self.stopped.set()
+        self.thread.join()
+        self._sample()
+        return self.cpu - self.cpu_before, self.peak_rss
+
+
+def start_worker(app, pool: str, concurrency: int, prefetch: int, env: dict) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "celery", "-A", "benchmarks.bench_worker_app:app", "worker",
+         "-P", pool, "-c", str(concurrency), "--prefetch-multiplier", str(prefetch),
+         "-Q", "probe,download", "-n", f"bench-{pool}-{concurrency}-{prefetch}@%h", "-l", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Воркер завершился с кодом {proc.returncode}")
+        if app.control.ping(timeout=1):
+            return proc
+    proc.kill()
+    raise RuntimeError("Воркер не ответил на ping за 60 с")
+
+
+def stop_worker(proc: subprocess.Popen):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def video_ids(count: int) -> list[str]:
+    alphabet = string.ascii_letters + string.digits
+    return ["bw" + "".join(random.choice(alphabet) for _ in range(9)) for _ in range(count)]
+
+
+def cleanup(videos: list[str]):
+    from redis_client import result_stream
+    from redis_client.client_redis import sync_redis
+
+    keys = [f"yt_info:{video_id}" for video_id in videos]
+    keys += [f"s3_index:{video_id}:18" for video_id in videos]
+    keys += [f"inflight:{video_id}:18:waiters" for video_id in videos]
+    keys += [f"progress:{video_id}:18" for video_id in videos]
+    # Стримы результатов в базе прогона читать некому
+    keys += [result_stream.STREAM_KEY, result_stream.PROGRESS_STREAM_KEY]
+    sync_redis.delete(*keys)
+
+
+def run_config(app, tasks, pool: str, concurrency: int, prefetch: int, args, env: dict) -> dict:
+    proc = start_worker(app, pool, concurrency, prefetch, env)
+    sampler = ResourceSampler(proc.pid).start()
+    videos = video_ids(args.jobs)
+    probes = video_ids(args.probes)
+    try:
+        started = time.perf_counter()
+        results = [
+            tasks.download_and_upload_video.delay(f"https://youtu.be/{video_id}", "dl|18", 0)
+            for video_id in videos
+        ]
+        results += [tasks.parse_youtube_formats.delay(0, f"https://youtu.be/{video_id}") for video_id in probes]
+        ResultSet(results).join(timeout=args.timeout, propagate=False)
+        wall = time.perf_counter() - started
+    finally:
+        cpu, rss = sampler.stop()
+        stop_worker(proc)
+        cleanup(videos + probes)
+
+    return {
+        "pool": pool, "concurrency": concurrency, "prefetch": prefetch,
+        "jobs_min": (args.jobs + args.probes) / wall * 60,
+        "bytes_s": args.jobs * args.media_mb * 1024 * 1024 / wall,
+        "cpu": cpu / wall, "rss": rss,
+    }
+
+
+def main(args):
+    # Рабочая база — как её увидит бот: из окружения или .env, с умолчанием конфига
+    if args.redis_db == get_config().redis.db:
+        sys.exit(f"--redis-db {args.redis_db} совпадает с рабочей базой REDIS_DB — выберите другую")
+
+    server = fakes.MediaServer(args.media_mb * 1024 * 1024, int(args.media_rate * 1024 * 1024)).start()
+    env = {
+        **os.environ,
+        "BENCH_MEDIA_SIZE": str(args.media_mb * 1024 * 1024),
+        "BENCH_MEDIA_URL": server.url,
+        "BENCH_PROBE_DELAY": str(args.probe_delay),
+        "BENCH_REDIS_DB": str(args.redis_db),
+        "BENCH_STREAM": "0" if args.no_stream else "1",
+        "REDIS_DB": str(args.redis_db),
+        "METRICS_ENABLED": "false",
+    }
+    # Этот процесс ставит задачи и убирает за ними — в той же базе, что и воркер
+    os.environ.update({k: v for k, v in env.items() if k.startswith("BENCH_") or k == "REDIS_DB"})
+    get_config.cache_clear()
+    from benchmarks import bench_worker_app
+    from celery_app import tasks
+
+    pools = [pool for pool in args.pools.split(",") if pool != "gevent" or importlib.util.find_spec("gevent")]
+    combos = itertools.product(pools, map(int, args.concurrency.split(",")), map(int, args.prefetch.split(",")))
+
+    print(f"{'pool':<8} {'conc':>4} {'pref':>4} {'jobs/min':>9} {'MB/s':>7} {'CPU':>6} {'RSS МБ':>7}")
+    try:
+        for pool, concurrency, prefetch in combos:
+            row = run_config(bench_worker_app.app, tasks, pool, concurrency, prefetch, args, env)
+            print(f"{row['pool']:<8} {row['concurrency']:>4} {row['prefetch']:>4} {row['jobs_min']:>9.1f} "
+                  f"{row['bytes_s'] / 1024 ** 2:>7.1f} {row['cpu'] * 100:>5.0f}% {row['rss'] / 1024 ** 2:>7.0f}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pools", default="prefork,threads,gevent")
+    parser.add_argument("--concurrency", default="2,4,8")
+    parser.add_argument("--prefetch", default="1,4")
+    parser.add_argument("--jobs", type=int, default=40, help="скачиваний на комбинацию")
+    parser.add_argument("--probes", type=int, default=40, help="разборов форматов на комбинацию")
+    parser.add_argument("--media-mb", type=int, default=16)
+    parser.add_argument("--media-rate", type=float, default=0, help="скорость отдачи на соединение, МБ/с")
+    parser.add_argument("--probe-delay", type=float, default=0.3, help="имитация extract_info, с")
+    parser.add_argument("--redis-db", type=int, default=15, help="база Redis для брокера прогона")
+    parser.add_argument("--no-stream", action="store_true", help="скачивать через временный файл, а не потоком в S3")
+    parser.add_argument("--timeout", type=float, default=1800)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""
+Проверка холодного старта: время импорта точек входа (python -X importtime) и то,
+что тяжёлые зависимости не загружаются при импорте. Код выхода 1 — регрессия,
+в том числе когда сравнивать не с чем: нет файла базы или в нём нет точки входа.
+
+Нужны переменные окружения как у бота (Celery читает адрес брокера при импорте задач).
+База снимается на той же машине, где потом проверяется, и сравнение идёт с ней:
+
+    uv run python -m benchmarks.check_import_time --save benchmarks/import_time.json
+    uv run python -m benchmarks.check_import_time --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Точка входа -> модули, которые она не должна импортировать сама (грузятся лениво при первом использовании)
+TARGETS = {
+    "bot": ("yt_dlp", "boto3", "botocore", "psycopg"),
+    "celery_app.tasks": ("yt_dlp", "boto3", "botocore", "psycopg"),
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_time.json")
+
+
+def measure(target: str) -> tuple[float, set[str]]:
+    """
+    Время импорта target в свежем интерпретаторе (мс) и множество загруженных пакетов верхнего уровня.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} завершился с ошибкой:\n{proc.stderr[-2000:]}")
+
+    cumulative_us = 0
+    packages = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue
+        packages.add(name.split(".")[0])
+        if name == target:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, packages
+
+
+def main(args) -> int:
+    results, failed = {}, False
+    for target, forbidden in TARGETS.items():
+        timings, packages = [], set()
+        for _ in range(args.runs):
+            ms, packages = measure(target)
+            timings.append(ms)
+        results[target] = statistics.median(timings)
+        print(f"{target:<20} {results[target]:8.1f} мс (медиана из {args.runs})")
+
+        eager = sorted(set(forbidden) & packages)
+        if eager:
+            print(f"  ✗ при импорте загружаются: {', '.join(eager)}")
+            failed = True
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    elif not os.path.exists(args.baseline):
+        # Без базы регрессию времени не увидеть — это провал проверки, а не пропуск
+        print(f"  ✗ нет базы {args.baseline}: снимите её с --save")
+        failed = True
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for target, ms in results.items():
+            if target not in baseline:
+                print(f"  ✗ {target}: нет в базе {args.baseline}")
+                failed = True
+                continue
+            limit = baseline[target] * (1 + args.tolerance)
+            if ms > limit:
+                print(f"  ✗ {target}: {ms:.1f} мс > {limit:.1f} мс (база {baseline[target]:.1f} мс)")
+                failed = True
+
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON с базовыми временами, мс")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост относительно базы")
+    parser.add_argument("--save", help="записать текущие времена как базу вместо сравнения")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,355 @@
+"""
+Подмены внешних сервисов для нагрузочных прогонов: Telegram Bot API, YouTube (yt-dlp) и S3.
+Redis и Postgres остаются настоящими (локальными).
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+from botocore.exceptions import ClientError
+
+CHUNK = 256 * 1024
+# Каталог с пакетом-заглушкой yt_dlp для подпроцессов потоковой загрузки
+STUB_YT_DLP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_yt_dlp")
+
+
+class FakeTelegramSession(BaseSession):
+    """
+    Сессия бота без сети: запоминает каждый вызов Bot API и отвечает правдоподобным результатом.
+    Ожидающие (expect) получают подходящее сообщение, как только бот его «отправил».
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.message_ids = itertools.count(1)
+        self.calls = 0
+        self.waiters: dict[int, list] = {}
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        self.calls += 1
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(chat_id, int):
+            for predicate, future in list(self.waiters.get(chat_id, ())):
+                if not future.done() and predicate(method):
+                    future.set_result(time.perf_counter())
+
+        if method.__returning__ is Message:
+            return Message(
+                message_id=next(self.message_ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    def expect(self, chat_id: int, predicate, timeout: float):
+        """
+        Регистрирует ожидание сразу (до отправки апдейта) и возвращает корутину,
+        которая дождётся вызова Bot API в chat_id с predicate(method) и вернёт perf_counter.
+        """
+        future = asyncio.get_running_loop().create_future()
+        entry = (predicate, future)
+        self.waiters.setdefault(chat_id, []).append(entry)
+
+        async def wait():
+            try:
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self.waiters[chat_id].remove(entry)
+                if not self.waiters[chat_id]:
+                    del self.waiters[chat_id]
+
+        return wait()
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def has_text(fragment: str):
+    return lambda method: fragment in (getattr(method, "text", None) or "")
+
+
+def has_button(prefix: str):
+    def predicate(method):
+        markup = getattr(method, "reply_markup", None)
+        rows = getattr(markup, "inline_keyboard", None) or []
+        return any((button.callback_data or "").startswith(prefix) for row in rows for button in row)
+    return predicate
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name="load", username=f"load{user_id}")
+
+
+def message_update(user_id: int, text: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        message=Message(
+            message_id=next(_update_ids),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=user_id, type="private"),
+            from_user=_user(user_id),
+            text=text,
+        ),
+    )
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    return Update(
+        update_id=next(_update_ids),
+        callback_query=CallbackQuery(
+            id=str(next(_update_ids)),
+            from_user=_user(user_id),
+            chat_instance="load",
+            data=data,
+            message=Message(
+                message_id=next(_update_ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=user_id, type="private"),
+                text="Выбери качество:",
+            ),
+        ),
+    )
+
+
+class FakeYoutubeDL:
+    """
+    Замена yt_dlp.YoutubeDL: отдаёт синтетические метаданные и «скачивает» size байт
+    со скоростью rate байт/с (0 — без ограничения), вызывая progress_hooks как настоящий.
+    Если задан media_url, байты читаются по HTTP с MediaServer.
+    """
+    size = 8 * 1024 * 1024
+    rate = 0
+    probe_delay = 0.0
+    media_url = None
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @classmethod
+    def configure(cls, size: int, rate: int = 0, probe_delay: float = 0.0, media_url: str | None = None):
+        cls.size, cls.rate, cls.probe_delay, cls.media_url = size, rate, probe_delay, media_url
+
+    def extract_info(self, url, download=False):
+        from utils.func import extract_video_id
+
+        if self.probe_delay:
+            time.sleep(self.probe_delay)
+        video_id = extract_video_id(url)
+        base = self.media_url or "http://fake.invalid"
+        return {
+            "id": video_id,
+            "title": f"Load test {video_id}",
+            "webpage_url": url,
+            "extractor": "youtube",
+            "formats": [
+                {"format_id": "18", "ext": "mp4", "format_note": "360p", "filesize": self.size,
+                 "protocol": "https", "url": f"{base}/{video_id}/18"},
+                {"format_id": "140", "ext": "m4a", "format_note": "audio", "filesize": self.size // 8,
+                 "protocol": "https", "url": f"{base}/{video_id}/140"},
+            ],
+        }
+
+    @staticmethod
+    def sanitize_info(info):
+        return info
+
+    def process_ie_result(self, info, download=True):
+        format_id = self.params.get("format")
+        format_info = next((f for f in info["formats"] if f["format_id"] == format_id), info["formats"][0])
+        if self.media_url:
+            self._fetch(format_info["url"], self.params["outtmpl"])
+        else:
+            self._write(self.params["outtmpl"], format_info["filesize"])
+        return info
+
+    def download(self, urls):
+        self.process_ie_result(self.extract_info(urls[0]))
+
+    def _write(self, path: str, size: int):
+        hooks = self.params.get("progress_hooks") or []
+        chunk = os.urandom(CHUNK)
+        written = 0
+        started = time.monotonic()
+        with open(path, "wb") as f:
+            while written < size:
+                part = chunk[:min(CHUNK, size - written)]
+                f.write(part)
+                written += len(part)
+                for hook in hooks:
+                    hook({"status": "downloading", "downloaded_bytes": written, "total_bytes": size})
+                if self.rate:
+                    # Держим заданную скорость «сети»
+                    ahead = written / self.rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+    def _fetch(self, url: str, path: str):
+        hooks = self.params.get("progress_hooks") or []
+        written = 0
+        with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+            total = int(response.headers.get("Content-Length") or 0)
+            while chunk := response.read(CHUNK):
+                f.write(chunk)
+                written += len(chunk)
+                for hook in hooks:
+                    hook({"status": "downloading", "downloaded_bytes": written, "total_bytes": total})
+
+
+class MediaServer:
+    """
+    Локальный HTTP-сервер синтетического медиа: GET /<video_id>/<format_id> отдаёт
+    ровно size байт (аудио — size / 8) со скоростью rate байт/с на соединение.
+    """
+
+    def __init__(self, size: int, rate: int = 0, host: str = "127.0.0.1", port: int = 0):
+        chunk = os.urandom(CHUNK)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                total = size // 8 if self.path.endswith("/140") else size
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(total))
+                self.end_headers()
+                sent = 0
+                started = time.monotonic()
+                while sent < total:
+                    part = chunk[:min(CHUNK, total - sent)]
+                    self.wfile.write(part)
+                    sent += len(part)
+                    if rate:
+                        ahead = sent / rate - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> "MediaServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class InProcessS3:
+    """
+    Замена клиента boto3 S3 в памяти процесса: хранит только размеры объектов.
+    Поддерживает вызовы, которые делает s3/s3_client.py.
+    """
+
+    def __init__(self):
+        self.objects: dict[str, int] = {}
+        self.uploads: dict[str, dict[int, int]] = {}
+        self.bytes_in = 0
+        self.lock = threading.Lock()
+        self.upload_ids = itertools.count(1)
+
+    def upload_fileobj(self, fileobj, bucket, key, Callback=None, **kwargs):
+        size = 0
+        while True:
+            chunk = fileobj.read(8 * 1024 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if Callback:
+                Callback(len(chunk))
+        with self.lock:
+            self.objects[f"{bucket}/{key}"] = size
+            self.bytes_in += size
+
+    def generate_presigned_url(self, client_method, Params=None, ExpiresIn=3600):
+        return f"https://s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def head_object(self, Bucket, Key):
+        with self.lock:
+            if f"{Bucket}/{Key}" in self.objects:
+                return {"ContentLength": self.objects[f"{Bucket}/{Key}"]}
+        raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = str(next(self.upload_ids))
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.uploads[UploadId][PartNumber] = len(Body)
+            self.bytes_in += len(Body)
+        return {"ETag": f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self.lock:
+            self.objects[f"{Bucket}/{Key}"] = sum(self.uploads.pop(UploadId).values())
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+
+
+class InlineTask:
+    """
+    Вместо брокера Celery: .delay() выполняет задачу в пуле потоков этого процесса.
+    """
+
+    def __init__(self, task, executor):
+        self.task = task
+        self.executor = executor
+
+    def delay(self, *args, **kwargs):
+        return self.executor.submit(self.task, *args, **kwargs)
+
+
+def install(size: int, rate: int = 0, probe_delay: float = 0.0, media_url: str | None = None,
+            stream: bool = True) -> InProcessS3:
+    """
+    Подменяет yt-dlp и S3 в модулях проекта. Возвращает хранилище S3 для отчёта.
+    Потоковая загрузка запускает `python -m yt_dlp` в подпроцессе — ему достаётся заглушка
+    из stub_yt_dlp. С stream=False задачи идут через временный файл.
+    """
+    from celery_app import tasks, video_cache
+    from config_data.config import get_config
+    from s3 import s3_client
+
+    FakeYoutubeDL.configure(size, rate, probe_delay, media_url)
+    video_cache.YoutubeDL = FakeYoutubeDL
+    tasks.YoutubeDL = FakeYoutubeDL
+    get_config().download.stream_upload = stream
+
+    # Окружение наследуют подпроцессы yt-dlp, сам процесс продолжает видеть настоящий пакет
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [STUB_YT_DLP, os.environ.get("PYTHONPATH")]))
+    os.environ["BENCH_MEDIA_RATE"] = str(rate)
+
+    storage = InProcessS3()
+    s3_client._s3_client = storage
+    return storage
@@ -0,0 +1,166 @@
+"""
+Нагрузочный прогон бота без Telegram, YouTube и S3.
+
+Синтетические апдейты идут через настоящий Dispatcher с handlers.router и sender.router,
+задачи Celery выполняются в пуле потоков этого же процесса, результаты доставляются
+через настоящий стрим в Redis. Нужны локальные Redis и Postgres (переменные окружения
+как у бота, миграции применены). Не запускайте рядом с живым ботом на том же Redis:
+прогон читает стрим результатов той же группой.
+
+Каждый виртуальный пользователь: /start → ссылка → кнопка с форматами → нажатие → ссылка на файл.
+Скачивание идёт потоком в S3 через заглушку yt-dlp в подпроцессе, с --no-stream — через временный файл.
+
+    uv run python -m benchmarks.loadtest --users 200 --concurrency 50 --videos 20 --media-mb 8
+"""
+import argparse
+import asyncio
+import random
+import resource
+import statistics
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.redis import RedisStorage
+from sqlalchemy import delete
+
+import handlers
+from benchmarks import fakes
+from celery_app.tasks import download_and_upload_video, parse_youtube_formats
+from db import write_behind
+from db.database import session_factory_async
+from db.log_sink import log_sink
+from db.models import Downloads, Logger
+from db.ORM import DataBase
+from middlewares.logger_middleware import LoggingMiddleware
+from redis_client.client_redis import redis_client
+from scheduler.check_s3 import consume_results
+from sender import sender
+from utils.rate_limit import THROTTLE_PREFIX
+
+# ID заведомо вне диапазона Telegram, чтобы не задеть реальных пользователей
+BASE_ID = 9_100_000_000_000
+
+
+def video_ids(count: int) -> list[str]:
+    rnd = random.Random(42)
+    alphabet = string.ascii_letters + string.digits
+    return ["lt" + "".join(rnd.choice(alphabet) for _ in range(9)) for _ in range(count)]
+
+
+async def run_user(dp: Dispatcher, bot: Bot, session: fakes.FakeTelegramSession, user_id: int, url: str,
+                   timeout: float, results: dict):
+    try:
+        waiting = session.expect(user_id, fakes.has_text("Привет"), timeout)
+        await dp.feed_update(bot, fakes.message_update(user_id, "/start"))
+        await waiting
+
+        started = time.perf_counter()
+        waiting = session.expect(user_id, fakes.has_button("dl|"), timeout)
+        await dp.feed_update(bot, fakes.message_update(user_id, url))
+        results["formats"].append(await waiting - started)
+
+        started = time.perf_counter()
+        waiting = session.expect(user_id, fakes.has_text("Готово"), timeout)
+        await dp.feed_update(bot, fakes.callback_update(user_id, "dl|18"))
+        results["download"].append(await waiting - started)
+        results["ok"] += 1
+    except asyncio.TimeoutError:
+        results["timeouts"] += 1
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)] if samples else 0.0
+
+
+def report(results: dict, wall: float, updates: int, session: fakes.FakeTelegramSession, storage, usage_before):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    print(f"\nпользователей: {results['ok']} успешно, {results['timeouts']} по таймауту, за {wall:.1f} с")
+    print(f"апдейтов: {updates} ({updates / wall:.1f}/с), вызовов Bot API: {session.calls}")
+    for name, label in (("formats", "ссылка → кнопки"), ("download", "нажатие → файл")):
+        samples = results[name]
+        if samples:
+            print(f"  {label:<16} p50 {statistics.median(samples) * 1000:8.1f} мс   "
+                  f"p95 {percentile(samples, 0.95) * 1000:8.1f} мс   max {max(samples) * 1000:8.1f} мс")
+    print(f"S3: {len(storage.objects)} объектов, {storage.bytes_in / 1024 ** 2:.1f} МБ")
+    print(f"CPU {cpu:.1f} с ({cpu / wall * 100:.0f}% ядра), пик RSS {usage.ru_maxrss / 1024:.0f} МБ")
+
+
+async def cleanup(user_ids: list[int], videos: list[str]):
+    # Сбрасываем накопленное так же, как бот, и убираем следы прогона из БД
+    await write_behind.flush()
+    async with session_factory_async() as session:
+        await session.execute(delete(Downloads).where(Downloads.user_id >= BASE_ID))
+        await session.execute(delete(Logger).where(Logger.user_id >= BASE_ID))
+        await session.commit()
+    for user_id in user_ids:
+        await DataBase.delete_user(user_id)
+    keys = []
+    for user_id in user_ids:
+        keys += [f"quota:downloads:{user_id}", f"user:{user_id}"]
+        keys += await redis_client.keys(f"{THROTTLE_PREFIX}{user_id}:*")
+        keys += await redis_client.keys(f"yt:{user_id}:*")
+    for video_id in videos:
+        keys += [f"yt_info:{video_id}"] + await redis_client.keys(f"s3_index:{video_id}:*")
+    if keys:
+        await redis_client.delete(*keys)
+
+
+async def main(args):
+    storage = fakes.install(args.media_mb * 1024 * 1024, int(args.media_rate * 1024 * 1024), args.probe_delay,
+                            stream=not args.no_stream)
+
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    handlers.parse_youtube_formats = fakes.InlineTask(parse_youtube_formats, executor)
+    handlers.download_and_upload_video = fakes.InlineTask(download_and_upload_video, executor)
+
+    session = fakes.FakeTelegramSession()
+    bot = Bot("123456:loadtest", session=session)
+    dp = Dispatcher(storage=RedisStorage(redis=redis_client))
+    dp.callback_query.middleware(LoggingMiddleware())
+    dp.message.middleware(LoggingMiddleware())
+    dp.include_router(handlers.router)
+    dp.include_router(sender.router)
+
+    log_sink.start()
+    consumer = asyncio.create_task(consume_results(bot))
+
+    videos = video_ids(args.videos)
+    user_ids = [BASE_ID + i for i in range(args.users)]
+    results = {"formats": [], "download": [], "ok": 0, "timeouts": 0}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id: int, index: int):
+        async with semaphore:
+            url = f"https://youtu.be/{videos[index % len(videos)]}"
+            await run_user(dp, bot, session, user_id, url, args.timeout, results)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(limited(user_id, i) for i, user_id in enumerate(user_ids)))
+        wall = time.perf_counter() - started
+        report(results, wall, 3 * args.users, session, storage, usage_before)
+    finally:
+        consumer.cancel()
+        await log_sink.stop()
+        executor.shutdown(wait=True)
+        await cleanup(user_ids, videos)
+        await dp.storage.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременно активных пользователей")
+    parser.add_argument("--videos", type=int, default=10, help="разных видео (повторы проверяют кэш и single-flight)")
+    parser.add_argument("--media-mb", type=int, default=8, help="размер синтетического файла")
+    parser.add_argument("--media-rate", type=float, default=0, help="скорость «скачивания», МБ/с (0 — без ограничения)")
+    parser.add_argument("--probe-delay", type=float, default=0.5, help="имитация extract_info, с")
+    parser.add_argument("--workers", type=int, default=8, help="потоков вместо Celery-воркеров")
+    parser.add_argument("--no-stream", action="store_true", help="скачивать через временный файл, а не потоком в S3")
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(main(parser.parse_args()))
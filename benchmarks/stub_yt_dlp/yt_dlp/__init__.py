@@ -0,0 +1,4 @@
+"""
+Заглушка yt-dlp для нагрузочных прогонов: fakes.install() ставит каталог stub_yt_dlp
+первым в PYTHONPATH, и потоковая загрузка запускает `python -m yt_dlp` отсюда.
+"""
@@ -0,0 +1,62 @@
+"""
+Ведёт себя как `yt-dlp --load-info-json info.json -f <format> -o -`: пишет в stdout
+filesize байт выбранного формата. Если url формата указывает на MediaServer, байты
+читаются оттуда, иначе генерируются со скоростью BENCH_MEDIA_RATE байт/с (0 — без ограничения).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+CHUNK = 256 * 1024
+# Так FakeYoutubeDL помечает ссылки без MediaServer
+OFFLINE_URL = "http://fake.invalid"
+
+
+def write(out, size: int, rate: int):
+    chunk = os.urandom(CHUNK)
+    written = 0
+    started = time.monotonic()
+    while written < size:
+        part = chunk[:min(CHUNK, size - written)]
+        out.write(part)
+        written += len(part)
+        if rate:
+            ahead = written / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def fetch(out, url: str):
+    with urllib.request.urlopen(url) as response:
+        while chunk := response.read(CHUNK):
+            out.write(chunk)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="yt_dlp")
+    parser.add_argument("--load-info-json", required=True)
+    parser.add_argument("-f", dest="format", required=True)
+    parser.add_argument("-o", dest="output", default="-")
+    args, _ = parser.parse_known_args()
+
+    with open(args.load_info_json) as f:
+        info = json.load(f)
+    format_info = next((f for f in info["formats"] if f["format_id"] == args.format), None)
+    if format_info is None:
+        print(f"ERROR: Requested format is not available: {args.format}", file=sys.stderr)
+        return 1
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    with out:
+        if format_info["url"].startswith(OFFLINE_URL):
+            write(out, format_info["filesize"], int(os.environ.get("BENCH_MEDIA_RATE", 0)))
+        else:
+            fetch(out, format_info["url"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
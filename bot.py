@@ -4,42 +4,63 @@ import limited_aiogram
 
 from aiogram import Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
+from apscheduler.events import EVENT_JOB_SUBMITTED
 
 import handlers
-from config_data.config import ConfigEnv, load_config
+from db import user_cache, write_behind
+from db.log_sink import log_sink
+from db.database import engine_pools
+from config_data.config import get_config
+from celery_app.tasks import DOWNLOAD_QUEUE, PROBE_QUEUE
 from middlewares.logger_middleware import LoggingMiddleware
+from middlewares.metrics_middleware import MetricsMiddleware
+from redis_client import result_stream
 from redis_client.client_redis import redis_client
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from scheduler.check_s3 import check_s3_results, check_formats_ready
+from scheduler.check_s3 import consume_results
 from sender import sender
+from utils import metrics
 from utils.main_menu import set_main_menu
 
-config: ConfigEnv = load_config()
-
 # Инициализируем логгер
 logger = logging.getLogger(__name__)
 
-bot = limited_aiogram.LimitedBot(token=config.tg_bot.token)
-
 storage = RedisStorage(redis=redis_client)
 
 scheduler = AsyncIOScheduler(timezone='Asia/Tbilisi')
 
 async def main():
-    # await start_http_server()
-
+    config = get_config()
+    bot = limited_aiogram.LimitedBot(token=config.tg_bot.token)
+
+    if config.metrics.enabled:
+        registry = metrics.start_metrics_server(config.metrics.bot_port)
+        # Очереди общие для всех воркеров — их глубину отдаёт только бот
+        registry.register(metrics.QueueDepthCollector(
+            (PROBE_QUEUE, DOWNLOAD_QUEUE),
+            streams=(result_stream.STREAM_KEY, result_stream.PROGRESS_STREAM_KEY),
+            group=result_stream.GROUP,
+        ))
+        # Занятость пулов соединений с Postgres
+        registry.register(metrics.PoolCollector(engine_pools, config.postgres.max_overflow))
+
+    # Запаздывание запусков задач планировщика
+    scheduler.add_listener(metrics.scheduler_listener, EVENT_JOB_SUBMITTED)
     scheduler.start()
 
-    scheduler.add_job(check_s3_results,
+    # Результаты Celery-задач приходят через Redis Stream, без опроса по KEYS
+    results_consumer = asyncio.create_task(consume_results(bot))
+    # Счётчики ссылок и журнал скачиваний копятся в Redis и сбрасываются в БД пачками
+    scheduler.add_job(write_behind.flush,
                       trigger="interval",
-                      seconds=10,
-                      kwargs={'bot': bot,},
-                      id='check_s3',
+                      seconds=30,
+                      id='write_behind_flush',
                       max_instances=1,
                       coalesce=True)
 
-    scheduler.add_job(check_formats_ready, "interval", seconds=2, args=[bot])
+    # Сброс локального кэша профилей при изменениях из других процессов и админки
+    cache_listener = asyncio.create_task(user_cache.listen_invalidations())
 
     # Конфигурируем логирование
     logging.basicConfig(
@@ -52,6 +73,11 @@ async def main():
 
     dp = Dispatcher(bot=bot, storage=storage)
 
+    # Журнал действий пишется фоном пачками; при остановке дописываем остаток
+    log_sink.start()
+    dp.shutdown.register(log_sink.stop)
+    dp.shutdown.register(write_behind.flush)
+
     # Регистрируем middleware
     dp.callback_query.middleware(LoggingMiddleware())
     dp.message.middleware(LoggingMiddleware())
@@ -59,10 +85,17 @@ async def main():
     dp.include_router(handlers.router)
     dp.include_router(sender.router)
 
+    # Время обработчиков по роутерам (внутренние middleware — только для найденных обработчиков)
+    for name, router in (("handlers", handlers.router), ("sender", sender.router)):
+        router.message.middleware(MetricsMiddleware(name, "message"))
+        router.callback_query.middleware(MetricsMiddleware(name, "callback_query"))
 
     # Настраиваем главное меню бота
     await set_main_menu(bot)
 
+    # Продолжаем рассылки, прерванные перезапуском
+    await sender.resume_mailings(bot)
+
     # Пропускаем накопившиеся апдейты и запускаем polling
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from redis_client import result_stream
+
+# Не чаще одной записи в PUBLISH_INTERVAL секунд на задачу (смена этапа публикуется сразу)
+PUBLISH_INTERVAL = 2.0
+
+
+class ProgressReporter:
+    """
+    Публикует компактный прогресс задачи в стрим bot:progress.
+    Формат значения: "<stage>|<done_bytes>|<total_bytes>".
+    """
+
+    def __init__(self, user_id: int, job: str, total: int | None = None):
+        self.user_id = user_id
+        self.job = job
+        self.total = total or 0
+        self.stage = None
+        self.done = 0
+        self.last_publish = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, stage: str, done: int, total: int | None = None, force: bool = False):
+        with self.lock:
+            now = time.monotonic()
+            stage_changed = stage != self.stage
+            self.stage, self.done = stage, done
+            if total:
+                self.total = total
+            if not (force or stage_changed or now - self.last_publish >= PUBLISH_INTERVAL):
+                return
+            self.last_publish = now
+            value = f"{stage}|{done}|{self.total}"
+
+        try:
+            result_stream.publish_progress(self.user_id, self.job, value)
+        except Exception:
+            # Прогресс — не повод ронять скачивание
+            pass
+
+    def download_hook(self, d: dict):
+        """
+        progress_hooks для yt-dlp.
+        """
+        if d.get("status") == "downloading":
+            self.update("download", d.get("downloaded_bytes") or 0,
+                        d.get("total_bytes") or d.get("total_bytes_estimate"))
+
+    def bytes_callback(self, stage: str):
+        """
+        Callback в стиле boto3 (Callback=...): получает приращение байт для этапа stage.
+        """
+        transferred = 0
+        lock = threading.Lock()
+
+        def callback(bytes_amount):
+            nonlocal transferred
+            with lock:
+                transferred += bytes_amount
+                done = transferred
+            self.update(stage, done)
+
+        return callback
@@ -1,66 +1,210 @@
 import json
 import os
+import subprocess
+import sys
 import tempfile
+import time
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown, worker_ready
+from kombu import Queue
 
-from yt_dlp import YoutubeDL
 import logging
-from config_data.config import ConfigEnv, load_config
-from s3.s3_client import upload_to_s3
-from utils.func import sanitize_filename
-from utils.trottle import del_throttle
-from redis import Redis
-
-config: ConfigEnv = load_config()
+from celery_app.progress import ProgressReporter
+from celery_app.ytdl import YoutubeDL, download_error
+from celery_app.workspace import get_workspace
+from celery_app.video_cache import get_video_info, invalidate_video_info
+from config_data.config import get_config
+from redis_client import job_timeline, result_stream, single_flight
+from s3 import object_index
+from s3.s3_client import upload_to_s3, generate_presigned_s3_url, StreamingUpload
+from utils import metrics
+from utils.func import sanitize_filename, extract_video_id
+from utils.rate_limit import release_throttle
 
 logger = logging.getLogger(__name__)
-sync_redis = Redis(host=config.redis.host, port=config.redis.port, password=config.redis.password)
 
+
+def _broker_url() -> str:
+    redis = get_config().redis
+    return f"redis://:{redis.password}@{redis.host}:{redis.port}/0"
+
+
+# Адрес брокера приложению Celery нужен уже при импорте модуля
 app = Celery(
     "tasks",
-    broker=f'redis://:{config.redis.password}@{config.redis.host}:{config.redis.port}/0',
-    backend=f"redis://:{config.redis.password}@{config.redis.host}:{config.redis.port}/0"
+    broker=_broker_url(),
+    backend=_broker_url(),
 )
 
+# Быстрый разбор форматов и долгие скачивания живут в разных очередях,
+# чтобы очередь скачиваний не задерживала показ кнопок с качеством
+PROBE_QUEUE = "probe"
+DOWNLOAD_QUEUE = "download"
+
+app.conf.task_queues = (Queue(PROBE_QUEUE), Queue(DOWNLOAD_QUEUE))
+app.conf.task_default_queue = PROBE_QUEUE
+app.conf.task_routes = {
+    "celery_app.tasks.parse_youtube_formats": {"queue": PROBE_QUEUE},
+    "celery_app.tasks.download_and_upload_video": {"queue": DOWNLOAD_QUEUE},
+}
+
+# Протоколы, которые yt-dlp умеет отдавать в stdout без постобработки
+STREAM_PROTOCOLS = ("https", "http", "http_dash_segments")
+# При потоковой загрузке на диске лежат только info.json и stderr yt-dlp
+STREAM_RESERVE = 16 * 1024 * 1024
+
+
+@worker_ready.connect
+def start_workspace_sweeper(**kwargs):
+    get_workspace().start_sweeper()
+
+
+@worker_ready.connect
+def start_metrics(**kwargs):
+    config = get_config()
+    if config.metrics.enabled:
+        metrics.start_metrics_server(config.metrics.worker_port)
+
+
+@worker_process_shutdown.connect
+def forget_process_metrics(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
+
+
+# Время старта задач текущего процесса по task_id
+_task_started: dict[str, float] = {}
+
+
+@task_prerun.connect
+def _start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
 @app.task(name="celery_app.tasks.parse_youtube_formats")
-def parse_youtube_formats(user_id, url):
+def parse_youtube_formats(user_id, url, cid=None):
+    job_timeline.mark_sync(cid, "started")
     try:
-        with YoutubeDL({"quiet": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            formats = [
-                {
-                    "format_id": f["format_id"],
-                    "format_note": f.get("format_note"),
-                    "ext": f.get("ext"),
-                    "filesize": f.get("filesize"),
-                }
-                for f in info["formats"]
-                if f.get("ext") in ["mp4", "m4a"] and f.get("filesize")
-            ]
-            formats = [f for f in formats if f["filesize"] and f["filesize"] > 0]
-            formats.sort(key=lambda f: f["filesize"], reverse=True)
-
-        # Пишем в Redis
-        key = f"yt_formats:{user_id}:{url}"
-        sync_redis.setex(key, 600, json.dumps(formats))  # храним 10 минут
+        info = get_video_info(url)
+        job_timeline.mark_sync(cid, "probed")
+        formats = [
+            {
+                "format_id": f["format_id"],
+                "format_note": f.get("format_note"),
+                "ext": f.get("ext"),
+                "filesize": f.get("filesize"),
+            }
+            for f in info["formats"]
+            if f.get("ext") in ["mp4", "m4a"] and f.get("filesize")
+        ]
+        formats = [f for f in formats if f["filesize"] and f["filesize"] > 0]
+        formats.sort(key=lambda f: f["filesize"], reverse=True)
+
+        # Отдаём боту через стрим результатов
+        result_stream.publish("formats", user_id, url, json.dumps(formats), cid=cid)
 
     except Exception as e:
-        key = f"yt_formats:{user_id}:{url}"
-        sync_redis.setex(key, 600, "error")
+        logger.exception(f"Ошибка получения форматов: {e}")
+        result_stream.publish("formats", user_id, url, "error", cid=cid)
     finally:
-        del_throttle(user_id, 'send')
+        release_throttle(user_id, 'send')
+
+
+def _download_to_file(info, url, format_id, full_path, reporter):
+    ydl_opts = {
+        "format": format_id,
+        "outtmpl": full_path,
+        "quiet": True,
+        "progress_hooks": [reporter.download_hook],
+    }
+
+    with YoutubeDL(ydl_opts) as ydl:
+        try:
+            # Метаданные уже есть в кэше — сразу качаем, без повторного extract_info
+            ydl.process_ie_result(info, download=True)
+        except download_error() as e:
+            # Подписанные ссылки могли протухнуть раньше TTL — качаем по-старому
+            logger.warning(f"Скачивание по кэшу не удалось, повторяем с extract_info: {e}")
+            invalidate_video_info(url)
+            ydl.download([url])
+
+
+def _can_stream(format_info) -> bool:
+    """
+    Формат можно стримить, если yt-dlp не нужно склеивать дорожки
+    или чинить контейнер через ffmpeg после скачивания.
+    """
+    return (
+        get_config().download.stream_upload
+        and "+" not in format_info["format_id"]
+        and format_info.get("protocol") in STREAM_PROTOCOLS
+        and format_info.get("container") != "m4a_dash"
+        and not format_info.get("is_live")
+    )
+
+
+def _stream_to_s3(info, format_id, s3_key, reporter, job_dir, cid=None):
+    """
+    Запускает yt-dlp с выводом в stdout и сразу грузит поток в S3 multipart-ом.
+    Части уходят в S3, пока следующие фрагменты ещё скачиваются.
+    """
+    info_path = os.path.join(job_dir, "info.json")
+    with open(info_path, "w") as f:
+        json.dump(info, f)
+
+    # Multipart-загрузку заводим до запуска yt-dlp: если S3 недоступен, подпроцесс не нужен
+    upload = StreamingUpload(s3_key, callback=reporter.bytes_callback("download"))
+    stderr = proc = None
+    try:
+        stderr = tempfile.TemporaryFile(dir=job_dir)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "yt_dlp", "--load-info-json", info_path,
+             "-f", format_id, "-o", "-", "--quiet", "--no-warnings", "--no-progress"],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+        size = upload.feed(proc.stdout)
+        # Сначала код выхода: при пустом потоке причина обычно в stderr yt-dlp
+        if proc.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"yt-dlp завершился с кодом {proc.returncode}: {stderr.read().decode(errors='ignore')}")
+        if not size:
+            raise ValueError(f"Пустой поток для {s3_key}")
+        job_timeline.mark_sync(cid, "fetched")
+        upload.complete()
+        metrics.DOWNLOADED_BYTES.labels("stream").inc(size)
+        logger.info(f"Загружено потоком {size} байт в {s3_key}")
+    except Exception:
+        upload.abort()
+        raise
+    finally:
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if stderr is not None:
+            stderr.close()
 
 
 @app.task(name="celery_app.tasks.download_and_upload_video")
-def download_and_upload_video(url, data, user_id):
+def download_and_upload_video(url, data, user_id, cid=None, flight=None):
+    _, format_id = data.split("|")
+    result = "error"
+    job_timeline.mark_sync(cid, "started")
+    heartbeat = single_flight.Heartbeat(extract_video_id(url), format_id, flight).start()
     try:
         logger.info('start celery')
 
-        with YoutubeDL({"quiet": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
+        info = get_video_info(url)
+        job_timeline.mark_sync(cid, "probed")
 
-        _, format_id = data.split("|")
+        video_id = info.get("id") or extract_video_id(url)
         title = sanitize_filename(info["title"])
         format_info = next(
             f for f in info["formats"]
@@ -68,41 +212,63 @@ def download_and_upload_video(url, data, user_id):
         )
         quality = format_info.get("format_note") or format_id
         ext = format_info.get("ext", "mp4")
+        reporter = ProgressReporter(user_id, f"{extract_video_id(url)}:{format_id}", format_info.get("filesize"))
 
-        tmp_dir = tempfile.gettempdir()
         filename_base = f"{title}_{quality}.{ext}"
 
-        # with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        #     tmp_path = tmp.name
+        s3_key = object_index.lookup(video_id, format_id, ext)
+        if s3_key:
+            # Этот формат уже лежит в бакете — только подписываем ссылку
+            logger.info(f"Найден готовый объект {s3_key}, скачивание пропущено")
+            s3_url = generate_presigned_s3_url(s3_key, expiration=43200, download_name=filename_base)
+        else:
+            s3_key = object_index.content_key(video_id, format_id, ext)
+            s3_url = None
 
-        full_path = os.path.join(tmp_dir, filename_base)
+            if _can_stream(format_info):
+                try:
+                    with get_workspace().job(STREAM_RESERVE) as job_dir:
+                        _stream_to_s3(info, format_id, s3_key, reporter, job_dir, cid)
+                    s3_url = generate_presigned_s3_url(s3_key, expiration=43200, download_name=filename_base)
+                except Exception as e:
+                    # Например, протухли подписанные ссылки — идём через временный файл и extract_info
+                    logger.warning(f"Потоковая загрузка не удалась, используем временный файл: {e}")
 
-        ydl_opts = {
-            "format": format_id,
-            "outtmpl": full_path,
-            "quiet": True,
-        }
+            if not s3_url:
+                # Резерв с запасом под .part и служебные файлы yt-dlp
+                reserve = int((format_info.get("filesize") or 0) * 1.1)
+                with get_workspace().job(reserve) as job_dir:
+                    full_path = os.path.join(job_dir, f"{format_id}.{ext}")
+                    _download_to_file(info, url, format_id, full_path, reporter)
+                    job_timeline.mark_sync(cid, "fetched")
+                    size = os.path.getsize(full_path)
+                    metrics.DOWNLOADED_BYTES.labels("file").inc(size)
+                    reporter.update("upload", 0, size)
+                    with open(full_path, "rb") as f:
+                        s3_url = upload_to_s3(f, s3_key, download_name=filename_base,
+                                              callback=reporter.bytes_callback("upload"))
 
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-
-        with open(full_path, "rb") as f:
-            s3_key = f"user_videos/{user_id}/{filename_base}"
-            s3_url = upload_to_s3(f, s3_key)
+            if s3_url:
+                job_timeline.mark_sync(cid, "uploaded")
+                object_index.remember(video_id, format_id, s3_key)
 
-        # Кладем ссылку в Redis
-        redis_key = f"s3||result||{user_id}||{url}"
-        sync_redis.set(redis_key, s3_url, ex=3600)
-        logger.info(f'Отправлен кей: {redis_key}')
-        try:
+        if not s3_url:
+            raise RuntimeError(f"Не удалось получить ссылку на {s3_key}")
 
-            os.remove(full_path)
-        except Exception:
-            pass
+        result = s3_url
 
     except Exception as e:
         logger.exception(f"Ошибка в Celery-задаче: {e}")
-        sync_redis.set(f"s3||result||{user_id}||{url}", "error", ex=600)
 
     finally:
-        del_throttle(user_id, 'dl')
+        # Раздаём результат всем, кто ждал этот же формат этого же видео
+        heartbeat.stop()
+        waiters = single_flight.release(extract_video_id(url), format_id, flight)
+        if not any(w["user_id"] == user_id for w in waiters):
+            waiters.append({"user_id": user_id, "url": url, "cid": cid})
+
+        for waiter in waiters:
+            result_stream.publish("download", waiter['user_id'], waiter['url'], result, cid=waiter.get('cid'),
+                                  job=f"{extract_video_id(url)}:{format_id}")
+            logger.info(f"Отправлен результат для {waiter['user_id']}: {waiter['url']}")
+            release_throttle(waiter['user_id'], 'dl')
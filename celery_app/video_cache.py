@@ -0,0 +1,103 @@
+import json
+import logging
+import time
+import zlib
+from urllib.parse import urlparse, parse_qs
+
+from celery_app.ytdl import YoutubeDL
+
+from redis_client.client_redis import sync_redis
+from utils.func import extract_video_id
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "yt_info:"
+STATS_KEY = "yt_info:stats"
+
+# Подписанные ссылки YouTube живут ~6 часов; берём запас, чтобы не отдать протухший URL
+DEFAULT_TTL = 3600
+MIN_TTL = 60
+MAX_TTL = 6 * 3600
+EXPIRE_MARGIN = 15 * 60
+
+# Только то, что нужно для выбора формата и скачивания без повторного extract_info
+INFO_KEYS = (
+    "id", "title", "fulltitle", "display_id", "duration", "uploader", "channel",
+    "extractor", "extractor_key", "webpage_url", "webpage_url_basename",
+    "webpage_url_domain", "original_url", "is_live", "live_status", "was_live",
+)
+SUPPORTED_EXT = ("mp4", "m4a")
+
+
+def _compact_info(info: dict) -> dict:
+    """
+    Оставляет в ответе yt-dlp только нужные поля и форматы mp4/m4a с известным размером.
+    """
+    compact = {key: info[key] for key in INFO_KEYS if key in info}
+    compact["formats"] = [
+        f for f in info.get("formats") or []
+        if f.get("ext") in SUPPORTED_EXT and f.get("filesize")
+    ]
+    return compact
+
+
+def _ttl_for(info: dict) -> int:
+    """
+    TTL кэша = время до истечения самой ранней подписанной ссылки формата минус запас.
+    """
+    expires = []
+    for f in info.get("formats", []):
+        expire = parse_qs(urlparse(f.get("url") or "").query).get("expire")
+        if expire and expire[0].isdigit():
+            expires.append(int(expire[0]))
+
+    if not expires:
+        return DEFAULT_TTL
+    ttl = min(expires) - int(time.time()) - EXPIRE_MARGIN
+    return max(MIN_TTL, min(ttl, MAX_TTL))
+
+
+def _dump(info: dict) -> bytes:
+    return zlib.compress(json.dumps(info, separators=(",", ":"), ensure_ascii=False).encode())
+
+
+def _load(raw: bytes) -> dict:
+    return json.loads(zlib.decompress(raw))
+
+
+def get_video_info(url: str) -> dict:
+    """
+    Возвращает метаданные видео из общего кэша в Redis,
+    при промахе вызывает extract_info и кладёт результат в кэш.
+    """
+    key = f"{CACHE_PREFIX}{extract_video_id(url)}"
+    raw = sync_redis.get(key)
+    if raw:
+        try:
+            info = _load(raw)
+            sync_redis.hincrby(STATS_KEY, "hit", 1)
+            return info
+        except Exception as e:
+            logger.warning(f"Битая запись кэша {key}: {e}")
+
+    sync_redis.hincrby(STATS_KEY, "miss", 1)
+    with YoutubeDL({"quiet": True}) as ydl:
+        info = _compact_info(ydl.sanitize_info(ydl.extract_info(url, download=False)))
+
+    sync_redis.setex(key, _ttl_for(info), _dump(info))
+    return info
+
+
+def invalidate_video_info(url: str):
+    sync_redis.delete(f"{CACHE_PREFIX}{extract_video_id(url)}")
+
+
+def cache_stats() -> dict:
+    """
+    Счётчики попаданий/промахов кэша метаданных.
+    """
+    raw = sync_redis.hgetall(STATS_KEY)
+    hit = int(raw.get(b"hit", 0))
+    miss = int(raw.get(b"miss", 0))
+    total = hit + miss
+    return {"hit": hit, "miss": miss, "ratio": hit / total if total else 0.0}
@@ -0,0 +1,160 @@
+import fcntl
+import functools
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config_data.config import get_config
+
+logger = logging.getLogger(__name__)
+
+OWNER_FILE = ".owner"
+LOCK_FILE = ".lock"
+# Расширения недокачанных файлов yt-dlp
+PARTIAL_SUFFIXES = (".part", ".ytdl")
+ADMISSION_POLL = 5
+
+
+class WorkspaceFull(Exception):
+    pass
+
+
+class Workspace:
+    """
+    Рабочие каталоги задач на локальном диске воркера.
+    У каждой задачи свой каталог, место под неё резервируется заранее:
+    если бюджета не хватает, задача ждёт, а не падает с ENOSPC.
+    """
+
+    def __init__(self, root: str, budget: int, min_free: int, stale_age: int):
+        self.root = root
+        self.budget = budget
+        self.min_free = min_free
+        self.stale_age = stale_age
+        self.hostname = socket.gethostname()
+
+    @contextmanager
+    def _locked(self):
+        # Каталог создаётся при первой задаче или очистке, а не при импорте:
+        # модуль импортирует и бот, которому рабочий каталог не нужен
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _owners(self):
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                with open(os.path.join(path, OWNER_FILE)) as f:
+                    yield path, json.load(f)
+            except (NotADirectoryError, FileNotFoundError, ValueError):
+                continue
+
+    def _try_admit(self, reserve: int) -> str | None:
+        with self._locked():
+            reserved = sum(owner.get("reserve", 0) for _, owner in self._owners())
+            free = shutil.disk_usage(self.root).free
+            fits_budget = reserved + reserve <= self.budget or reserved == 0
+            if not fits_budget or free - reserve < self.min_free:
+                return None
+
+            path = os.path.join(self.root, uuid.uuid4().hex)
+            os.makedirs(path)
+            with open(os.path.join(path, OWNER_FILE), "w") as f:
+                json.dump({"pid": os.getpid(), "host": self.hostname, "reserve": reserve, "created": time.time()}, f)
+            return path
+
+    @contextmanager
+    def job(self, reserve: int, timeout: int | None = None):
+        """
+        Выделяет каталог под задачу с резервом reserve байт и удаляет его по завершении.
+        """
+        if timeout is None:
+            timeout = get_config().download.admission_timeout
+        deadline = time.monotonic() + timeout
+        path = self._try_admit(reserve)
+        while path is None:
+            if time.monotonic() >= deadline:
+                raise WorkspaceFull(f"Нет места под задачу ({reserve} байт) за {timeout} сек.")
+            logger.info(f"Ждём место на диске под задачу ({reserve} байт)")
+            time.sleep(ADMISSION_POLL)
+            path = self._try_admit(reserve)
+
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _is_orphan(self, owner: dict) -> bool:
+        if time.time() - owner.get("created", 0) > self.stale_age:
+            return True
+        if owner.get("host") != self.hostname:
+            return False
+        try:
+            os.kill(owner["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def sweep(self):
+        """
+        Удаляет каталоги умерших задач и старые недокачанные/брошенные файлы.
+        """
+        removed = 0
+        with self._locked():
+            for path, owner in list(self._owners()):
+                if self._is_orphan(owner):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+
+        now = time.time()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name in (LOCK_FILE, OWNER_FILE):
+                    continue
+                orphan = dirpath == self.root or name.endswith(PARTIAL_SUFFIXES)
+                try:
+                    if orphan and now - os.path.getmtime(path) > self.stale_age:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+
+        if removed:
+            logger.info(f"Очистка рабочего каталога: удалено {removed} объектов")
+
+    def start_sweeper(self, interval: int | None = None):
+        if interval is None:
+            interval = get_config().download.sweep_interval
+
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.exception(f"Ошибка очистки рабочего каталога: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="workspace-sweeper", daemon=True).start()
+
+
+@functools.cache
+def get_workspace() -> Workspace:
+    """
+    Рабочий каталог воркера по настройкам из конфига.
+    """
+    download = get_config().download
+    return Workspace(download.workspace_dir, download.disk_budget, download.min_free, download.stale_age)
@@ -0,0 +1,19 @@
+"""
+Ленивый доступ к yt-dlp. Импорт yt_dlp тянет все экстракторы и занимает заметную
+часть старта процесса, а нужен только воркеру при первой задаче.
+"""
+
+
+def YoutubeDL(params=None):
+    from yt_dlp import YoutubeDL as _YoutubeDL
+
+    return _YoutubeDL(params)
+
+
+def download_error():
+    """
+    Класс DownloadError (для except после того, как yt-dlp уже загружен).
+    """
+    from yt_dlp.utils import DownloadError
+
+    return DownloadError
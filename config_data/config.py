@@ -1,3 +1,6 @@
+import functools
+import os
+import tempfile
 from dataclasses import dataclass
 from environs import Env
 
@@ -20,12 +23,26 @@ class Postgres:
     user: str
     password: str
     database: str
+    # Кэш подготовленных выражений asyncpg на соединение (0 — выключен)
+    statement_cache_size: int = 500
+    # Пул соединений на процесс: постоянные + временные сверх них, ожидание свободного, пересоздание
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # Подключение через PgBouncer в режиме transaction: без серверных prepared statements
+    pgbouncer: bool = False
+    # Не держать свой пул (соединения пулит PgBouncer)
+    null_pool: bool = False
 
 @dataclass
 class Redis:
     host: str
     port: int
     password: str
+    # База для данных приложения (кэши, стримы, счётчики); брокер Celery настраивается отдельно
+    db: int = 0
 
 @dataclass
 class S3:
@@ -33,6 +50,39 @@ class S3:
     key_secret: str
     url: str
     name: str
+    # Параметры потоковой multipart-загрузки
+    part_size: int = 16 * 1024 * 1024
+    buffer_parts: int = 4
+    upload_workers: int = 4
+
+
+@dataclass
+class Download:
+    # Стримить вывод yt-dlp сразу в S3 без временного файла
+    stream_upload: bool = True
+    # Рабочие каталоги задач и бюджет диска под них
+    workspace_dir: str = os.path.join(tempfile.gettempdir(), "yt_jobs")
+    disk_budget: int = 20 * 1024 ** 3
+    min_free: int = 1024 ** 3
+    admission_timeout: int = 1800
+    # Сборщик мусора: возраст, после которого файлы считаются брошенными, и период обхода
+    stale_age: int = 6 * 3600
+    sweep_interval: int = 300
+
+
+@dataclass
+class Mailing:
+    # Общий лимит Telegram ~30 сообщений/сек, держим запас
+    rate: float = 25
+    workers: int = 20
+
+
+@dataclass
+class Metrics:
+    # Эндпоинт Prometheus /metrics у бота и у каждого Celery-воркера
+    enabled: bool = True
+    bot_port: int = 9100
+    worker_port: int = 9101
 
 
 @dataclass
@@ -41,8 +91,11 @@ class ConfigEnv:
     postgres: Postgres
     redis: Redis
     s3: S3
+    download: Download
+    mailing: Mailing
+    metrics: Metrics
 
-def load_config(path: str | None = None) -> ConfigEnv:
+def _read_config(path: str | None = None) -> ConfigEnv:
     env = Env()
     env.read_env(path)
     return ConfigEnv(
@@ -59,27 +112,80 @@ def load_config(path: str | None = None) -> ConfigEnv:
             user=env('POSTGRES_USER'),
             password=env('POSTGRES_PASSWORD'),
             database=env('POSTGRES_DB'),
+            statement_cache_size=env.int('POSTGRES_STATEMENT_CACHE_SIZE', 500),
+            pool_size=env.int('POSTGRES_POOL_SIZE', 5),
+            max_overflow=env.int('POSTGRES_MAX_OVERFLOW', 10),
+            pool_timeout=env.float('POSTGRES_POOL_TIMEOUT', 30),
+            pool_recycle=env.int('POSTGRES_POOL_RECYCLE', 1800),
+            pool_pre_ping=env.bool('POSTGRES_POOL_PRE_PING', True),
+            pgbouncer=env.bool('POSTGRES_PGBOUNCER', False),
+            null_pool=env.bool('POSTGRES_NULL_POOL', False),
         ),
         redis=Redis(
             host=env('REDIS_HOST'),
             port=env('REDIS_PORT'),
             password=env('REDIS_PASSWORD'),
+            db=env.int('REDIS_DB', 0),
         ),
         s3=S3(
             key_id=env('S3_ACCESS_KEY_ID'),
             key_secret=env('S3_ACCESS_KEY_SECRET'),
             url=env('S3_ENDPOINT_URL'),
-            name=env('S3_BUCKET_NAME')
-        ),  
+            name=env('S3_BUCKET_NAME'),
+            part_size=env.int('S3_PART_SIZE_MB', 16) * 1024 * 1024,
+            buffer_parts=env.int('S3_BUFFER_PARTS', 4),
+            upload_workers=env.int('S3_UPLOAD_WORKERS', 4),
+        ),
+        download=Download(
+            stream_upload=env.bool('STREAM_UPLOAD', True),
+            workspace_dir=env('WORKSPACE_DIR', os.path.join(tempfile.gettempdir(), "yt_jobs")),
+            disk_budget=env.int('DOWNLOAD_DISK_BUDGET_GB', 20) * 1024 ** 3,
+            min_free=env.int('DOWNLOAD_MIN_FREE_MB', 1024) * 1024 ** 2,
+            admission_timeout=env.int('DOWNLOAD_ADMISSION_TIMEOUT', 1800),
+            stale_age=env.int('WORKSPACE_STALE_AGE', 6 * 3600),
+            sweep_interval=env.int('WORKSPACE_SWEEP_INTERVAL', 300),
+        ),
+        mailing=Mailing(
+            rate=env.float('MAILING_RATE', 25),
+            workers=env.int('MAILING_WORKERS', 20),
+        ),
+        metrics=Metrics(
+            enabled=env.bool('METRICS_ENABLED', True),
+            bot_port=env.int('METRICS_BOT_PORT', 9100),
+            worker_port=env.int('METRICS_WORKER_PORT', 9101),
+        ),
     )
 
-config: ConfigEnv = load_config()
+
+@functools.cache
+def get_config() -> ConfigEnv:
+    """
+    Конфигурация процесса: окружение читается один раз, при первом обращении.
+    """
+    return _read_config()
+
+
+def load_config(path: str | None = None) -> ConfigEnv:
+    """
+    Без path возвращает общий экземпляр get_config(); с path — отдельно прочитанный из этого файла.
+    """
+    if path is None:
+        return get_config()
+    return _read_config(path)
+
+
+def __getattr__(name: str):
+    # from config_data.config import config — тоже общий экземпляр, без чтения окружения при импорте модуля
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def DATABASE_URL_asyncpg():
     """
     Формирует URL подключения для asyncpg
     """
+    config = get_config()
     return f'postgresql+asyncpg://{config.postgres.user}:{config.postgres.password}@{config.postgres.host}:{config.postgres.port}/{config.postgres.database}'
 
 
@@ -87,4 +193,5 @@ def DATABASE_URL_psycorg():
     """
     Формирует URL подключения для psycopg
     """
+    config = get_config()
     return f'postgresql+psycopg://{config.postgres.user}:{config.postgres.password}@{config.postgres.host}:{config.postgres.port}/{config.postgres.database}'
@@ -2,18 +2,21 @@ import logging
 import random
 from datetime import datetime, timedelta, timezone
 
+from db import user_cache
 from db.database import *
-from db.models import Logger, Users, Downloads
+from db.models import Logger, Users, Downloads, WriteBehindBatches
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
-from sqlalchemy import update, delete, func
+from sqlalchemy import update, delete, func, values, column, insert, all_, any_, bindparam, ARRAY, BigInteger, Integer
 from sqlalchemy.exc import IntegrityError
-from config_data.config import ConfigEnv, load_config
-
-config: ConfigEnv = load_config()
 
 # Инициализируем логгер
 logger = logging.getLogger(__name__)
 
+# Сколько хранить id применённых пачек отложенной записи. Повторно может прийти только
+# последняя пачка (упали между коммитом и очисткой Redis) — запас на долгий простой бота
+WRITE_BEHIND_RETENTION = timedelta(days=7)
+
 
 class LoggerORM:
 
@@ -27,6 +30,22 @@ class LoggerORM:
             session.add(new_log)
             await session.commit()
 
+    @staticmethod
+    async def create_logs(rows: list[tuple]):
+        """
+        Пакетная запись логов через COPY.
+        rows: (timestamp, user_id, user_name, action, type)
+        """
+        async with session_factory_async() as session:
+            connection = await session.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                Logger.__tablename__,
+                records=rows,
+                columns=["timestamp", "user_id", "user_name", "action", "type"],
+            )
+            await session.commit()
+
 class SenderORM:
     @staticmethod
     async def get_all_user_ids_active():
@@ -44,57 +63,124 @@ class SenderORM:
                 logger.error(f"Ошибка при получении ID активных пользователей: {e}")
                 return []
 
+    @staticmethod
+    async def iter_active_user_ids(after_id: int = 0, exclude: list[int] | None = None, page_size: int = 1000):
+        """
+        Асинхронный генератор ID активных пользователей по возрастанию user_id.
+        Читает страницами по первичному ключу (keyset pagination), исключения фильтруются в SQL.
+        """
+        exclude_param = bindparam("exclude", list(exclude or []), type_=ARRAY(BigInteger))
+        while True:
+            query = (
+                select(Users.user_id)
+                .where(Users.status == "active", Users.user_id > after_id)
+                .order_by(Users.user_id)
+                .limit(page_size)
+            )
+            if exclude:
+                query = query.where(Users.user_id != all_(exclude_param))
+            async with session_factory_async() as session:
+                page = (await session.execute(query)).scalars().all()
+            if not page:
+                return
+            for user_id in page:
+                yield user_id
+            after_id = page[-1]
+
+    @staticmethod
+    async def count_active_users(exclude: list[int] | None = None) -> int:
+        """
+        Количество активных пользователей без исключённых.
+        """
+        query = select(func.count()).select_from(Users).where(Users.status == "active")
+        if exclude:
+            query = query.where(Users.user_id != all_(bindparam("exclude", list(exclude), type_=ARRAY(BigInteger))))
+        async with session_factory_async() as session:
+            return (await session.execute(query)).scalar_one()
+
     @staticmethod
     async def update_user_status(user_id: int, new_status: str) -> bool:
         """
         Обновляет статус пользователя (active, blocked, deleted)
         """
         async with session_factory_async() as session:
-            query = select(Users).filter(Users.user_id == user_id)
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
+            query = (
+                update(Users)
+                .where(Users.user_id == user_id)
+                .values(status=new_status)
+                .returning(Users.user_id)
+                .execution_options(synchronize_session=False)
+            )
+            try:
+                result = await session.execute(query)
+                updated = result.scalar_one_or_none()
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"[DB] Ошибка при обновлении статуса пользователя {user_id}: {e}")
+                return False
 
-            if not user:
+            if updated is None:
                 logger.warning(f"[DB] Не найден пользователь для обновления статуса: {user_id}")
                 return False
 
-            user.status = new_status
+            await user_cache.invalidate(user_id)
+            logger.info(f"[DB] Статус пользователя {user_id} обновлен на {new_status}")
+            return True
+
+    @staticmethod
+    async def bulk_update_status(user_ids: list[int], new_status: str) -> int:
+        """
+        Одним UPDATE переводит пачку пользователей в статус new_status.
+        Возвращает число обновлённых строк.
+        """
+        if not user_ids:
+            return 0
+        async with session_factory_async() as session:
+            query = (
+                update(Users)
+                .where(Users.user_id == any_(bindparam("ids", list(user_ids), type_=ARRAY(BigInteger))))
+                .values(status=new_status)
+                .returning(Users.user_id)
+                .execution_options(synchronize_session=False)
+            )
             try:
+                updated = (await session.execute(query)).scalars().all()
                 await session.commit()
-                logger.info(f"[DB] Статус пользователя {user_id} обновлен на {new_status}")
-                return True
             except Exception as e:
                 await session.rollback()
-                logger.error(f"[DB] Ошибка при обновлении статуса пользователя {user_id}: {e}")
-                return False
+                logger.error(f"[DB] Ошибка пакетного обновления статуса {new_status} ({len(user_ids)} польз.): {e}")
+                return 0
+
+        await user_cache.invalidate_many(updated)
+        logger.info(f"[DB] Статус {new_status} выставлен {len(updated)} пользователям")
+        return len(updated)
 
 class DataBase:
     @staticmethod
     async def insert_user(user_id: int, user_name: str):
-        """Добавляет нового пользователя в БД или обновляет данные существующего"""
+        """Добавляет нового пользователя в БД; существующего не трогает"""
         async with session_factory_async() as session:
-            # Проверка, существует ли пользователь
-            query = select(Users).filter(Users.user_id == user_id)
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
-
-            if user:
-                return False
-            else:
-                # Если пользователь не найден, создаем нового
-                user = Users(
-                    user_id=user_id,
-                    user_name=user_name,
-                )
-                session.add(user)
-
-            # Сохраняем изменения
+            # Один INSERT ... ON CONFLICT DO NOTHING вместо проверки и вставки
+            query = (
+                pg_insert(Users)
+                .values(user_id=user_id, user_name=user_name)
+                .on_conflict_do_nothing(index_elements=[Users.user_id])
+                .returning(Users.user_id)
+            )
             try:
+                result = await session.execute(query)
+                inserted = result.scalar_one_or_none()
                 await session.commit()
             except IntegrityError as e:
                 logger.error(f"Error inserting user: {e}")
                 await session.rollback()
                 return False
+
+            if inserted is None:
+                return False
+            # Мог быть закэширован как отсутствующий
+            await user_cache.invalidate(user_id)
             return True
 
     @staticmethod
@@ -125,9 +211,9 @@ class DataBase:
         Возвращает дату первого взаимодействия пользователя (created_at)
         """
         async with session_factory_async() as session:
-            query = select(Users).where(Users.user_id == user_id)
+            query = select(Users.created_at, Users.user_id).where(Users.user_id == user_id)
             result = await session.execute(query)
-            user = result.scalar_one_or_none()
+            user = result.one_or_none()
 
             if user:
                 return user.created_at
@@ -143,23 +229,19 @@ class DataBase:
         """
         async with session_factory_async() as session:
             try:
-                query = select(Users).filter(Users.user_id == user_id)
+                query = delete(Users).where(Users.user_id == user_id).returning(Users.user_id)
                 result = await session.execute(query)
-                user = result.scalar_one_or_none()
-
-                if not user:
-                    return False
-
-                await session.delete(user)
+                deleted = result.scalar_one_or_none()
                 await session.commit()
-                return True
-
             except Exception as e:
                 await session.rollback()
                 logger.error(f"[DB] Ошибка при удалении пользователя {user_id}: {e}")
                 return False
 
-
+            if deleted is None:
+                return False
+            await user_cache.invalidate(user_id)
+            return True
 
     @staticmethod
     async def increment_sent_links(user_id: int) -> bool:
@@ -167,28 +249,77 @@ class DataBase:
         Увеличивает счётчик отправленных пользователю ссылок на 1.
         """
         async with session_factory_async() as session:
-            query = select(Users).filter(Users.user_id == user_id)
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
-
-            if not user:
-                logger.warning(f"[DB] Не найден пользователь для инкремента ссылок: {user_id}")
-                return False
-
-            user.sent_links = (user.sent_links or 0) + 1
+            query = (
+                update(Users)
+                .where(Users.user_id == user_id)
+                .values(sent_links=Users.sent_links + 1)
+                .returning(Users.sent_links)
+                .execution_options(synchronize_session=False)
+            )
             try:
+                result = await session.execute(query)
+                sent_links = result.scalar_one_or_none()
                 await session.commit()
-                logger.info(f"[DB] Счётчик ссылок для {user_id} увеличен: {user.sent_links}")
-                return True
             except Exception as e:
                 await session.rollback()
                 logger.error(f"[DB] Ошибка при увеличении счётчика ссылок {user_id}: {e}")
                 return False
 
+            if sent_links is None:
+                logger.warning(f"[DB] Не найден пользователь для инкремента ссылок: {user_id}")
+                return False
+            logger.info(f"[DB] Счётчик ссылок для {user_id} увеличен: {sent_links}")
+            return True
+
     @staticmethod
     async def log_download(user_id: int, url_orig: str):
         """Логирует факт скачивания файла."""
         async with session_factory_async() as session:
             download = Downloads(user_id=user_id, url_orig=url_orig)
             session.add(download)
-            await session.commit()
\ No newline at end of file
+            await session.commit()
+
+    @staticmethod
+    async def apply_write_behind(batch_id: str, sent_links: dict[int, int], downloads: list[tuple]) -> bool:
+        """
+        Применяет пачку отложенной записи в одной транзакции:
+        один UPDATE ... FROM (VALUES ...) для счётчиков и одну вставку скачиваний.
+        Пачка с тем же batch_id применяется только один раз; отметки старше
+        WRITE_BEHIND_RETENTION удаляются в той же транзакции.
+        Возвращает False, если пачка уже была применена раньше.
+        """
+        async with session_factory_async() as session:
+            async with session.begin():
+                await session.execute(
+                    delete(WriteBehindBatches)
+                    .where(WriteBehindBatches.applied_at < datetime.now() - WRITE_BEHIND_RETENTION)
+                )
+                marker = await session.execute(
+                    pg_insert(WriteBehindBatches)
+                    .values(batch_id=batch_id)
+                    .on_conflict_do_nothing(index_elements=[WriteBehindBatches.batch_id])
+                    .returning(WriteBehindBatches.batch_id)
+                )
+                if marker.scalar_one_or_none() is None:
+                    return False
+
+                if sent_links:
+                    deltas = values(
+                        column("user_id", BigInteger), column("delta", Integer), name="deltas"
+                    ).data(list(sent_links.items()))
+                    await session.execute(
+                        update(Users)
+                        .where(Users.user_id == deltas.c.user_id)
+                        .values(sent_links=Users.sent_links + deltas.c.delta)
+                        .execution_options(synchronize_session=False)
+                    )
+
+                if downloads:
+                    await session.execute(
+                        insert(Downloads),
+                        [
+                            {"user_id": user_id, "url_orig": url_orig, "downloaded_at": downloaded_at}
+                            for user_id, url_orig, downloaded_at in downloads
+                        ],
+                    )
+            return True
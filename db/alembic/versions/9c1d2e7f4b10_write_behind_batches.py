@@ -0,0 +1,32 @@
+"""write behind batches
+
+Revision ID: 9c1d2e7f4b10
+Revises: 4a302ae11051
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1d2e7f4b10'
+down_revision: Union[str, Sequence[str], None] = '4a302ae11051'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('write_behind_batches',
+    sa.Column('batch_id', sa.String(), nullable=False),
+    sa.Column('applied_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('write_behind_batches')
@@ -1,16 +1,126 @@
+import functools
+import time
+import uuid
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from config_data.config import DATABASE_URL_psycorg, DATABASE_URL_asyncpg, get_config
+from utils.metrics import POOL_CHECKOUT_TIMEOUTS, POOL_CHECKOUT_WAIT, instrument_engine
+
+
+class _TimedCheckout:
+    """
+    Замеряет ожидание соединения в _do_get: при исчерпанном пуле здесь копится очередь.
+    """
+    metrics_label = ""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(self.metrics_label).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.metrics_label).observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    metrics_label = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def _pool_options(pool_class) -> dict:
+    """
+    Параметры пула из конфига. С POSTGRES_NULL_POOL соединения не переиспользуются
+    процессом — этим занимается PgBouncer.
+    """
+    postgres = get_config().postgres
+    if postgres.null_pool:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": pool_class,
+        "pool_size": postgres.pool_size,
+        "max_overflow": postgres.max_overflow,
+        "pool_timeout": postgres.pool_timeout,
+        "pool_recycle": postgres.pool_recycle,
+        "pool_pre_ping": postgres.pool_pre_ping,
+    }
 
-from config_data.config import DATABASE_URL_psycorg, DATABASE_URL_asyncpg
 
-# Синхронный движок и сессия
-engine = create_engine(DATABASE_URL_psycorg(), echo=False)
-session_factory = sessionmaker(bind=engine)
+def _asyncpg_options() -> tuple[URL, dict]:
+    """
+    URL и connect_args для asyncpg. PgBouncer в режиме transaction отдаёт каждую транзакцию
+    разным серверным соединениям, поэтому кэши prepared statements выключаются,
+    а имена неизбежных одноразовых выражений делаются уникальными.
+    """
+    postgres = get_config().postgres
+    url = make_url(DATABASE_URL_asyncpg())
+    if not postgres.pgbouncer:
+        # Горячие запросы (upsert, update ... returning) готовятся один раз на соединение
+        url = url.update_query_dict({"prepared_statement_cache_size": str(postgres.statement_cache_size)})
+        return url, {}
+
+    url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+    return url, {
+        "statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4().hex}__",
+    }
+
+
+@functools.cache
+def get_sync_engine():
+    """
+    Синхронный движок (psycopg) нужен редко — создаём при первом обращении.
+    """
+    connect_args = {"prepare_threshold": None} if get_config().postgres.pgbouncer else {}
+    sync_engine = create_engine(DATABASE_URL_psycorg(), echo=False, connect_args=connect_args,
+                                **_pool_options(TimedQueuePool))
+    instrument_engine(sync_engine)
+    return sync_engine
+
+
+@functools.cache
+def get_session_factory():
+    return sessionmaker(bind=get_sync_engine())
+
+
+def __getattr__(name: str):
+    # Старые имена engine / session_factory тоже создаются лениво
+    if name == "engine":
+        return get_sync_engine()
+    if name == "session_factory":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def engine_pools() -> dict:
+    """
+    Пулы созданных движков для метрик загрузки.
+    """
+    pools = {"async": async_engine.pool}
+    if get_sync_engine.cache_info().currsize:
+        pools["sync"] = get_sync_engine().pool
+    return pools
+
 
 # асинхронный движок и сессия
+_async_url, _async_connect_args = _asyncpg_options()
 async_engine = create_async_engine(
-    url=DATABASE_URL_asyncpg(),
-    echo=False
+    url=_async_url,
+    echo=False,
+    connect_args=_async_connect_args,
+    **_pool_options(TimedAsyncQueuePool),
 )
 session_factory_async = async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Время запросов в метрики Prometheus
+instrument_engine(async_engine.sync_engine)
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from db.ORM import LoggerORM
+
+logger = logging.getLogger(__name__)
+
+# Паузы между повторными попытками записи пачки, с
+RETRY_DELAYS = (1, 5)
+# Сигнал фоновой задаче: дописать набранное и завершиться
+_STOP = object()
+
+
+class LogSink:
+    """
+    Буфер журнала действий пользователей.
+    Middleware только кладёт запись в очередь, а фоновая задача пишет пачками
+    (по размеру пачки или по таймеру), так что обработчики не ждут Postgres.
+    """
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 2.0):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.task: asyncio.Task | None = None
+
+    def put(self, user_id, user_name, action, type):
+        try:
+            self.queue.put_nowait((datetime.now(), user_id, user_name, action, type))
+        except asyncio.QueueFull:
+            # Журнал не важнее ответа пользователю: при переполнении отбрасываем
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Буфер журнала переполнен, отброшено записей: {self.dropped}")
+
+    async def _write(self, rows: list):
+        for attempt, delay in enumerate(RETRY_DELAYS + (None,)):
+            try:
+                await LoggerORM.create_logs(rows)
+                return
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала ({len(rows)} записей), попытка {attempt + 1}: {e}")
+            if delay is not None:
+                # Не долбим упавший Postgres: записи пока копятся в очереди
+                await asyncio.sleep(delay)
+        self.dropped += len(rows)
+
+    async def _drain(self):
+        rows = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is _STOP:
+                continue
+            rows.append(item)
+            if len(rows) >= self.batch_size:
+                await self._write(rows)
+                rows = []
+        if rows:
+            await self._write(rows)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is _STOP:
+                break
+            rows = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                rows.append(item)
+            await self._write(rows)
+        # Записи, положенные уже после сигнала остановки
+        await self._drain()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и дописывает всё, что осталось в очереди,
+        включая пачку, которую задача уже набирала.
+        """
+        if not self.task:
+            await self._drain()
+            return
+        # Метка в конце очереди: всё, что до неё, задача запишет сама
+        await self.queue.put(_STOP)
+        await self.task
+        self.task = None
+
+
+log_sink = LogSink()
@@ -45,3 +45,14 @@ class Logger(Base):
     type = Column(String)
     action = Column(String)
 
+
+
+class WriteBehindBatches(Base):
+    """
+    Применённые пачки отложенной записи (счётчики и скачивания из Redis).
+    Нужна, чтобы повторный сброс той же пачки после сбоя не задвоил данные.
+    """
+    __tablename__ = 'write_behind_batches'
+
+    batch_id = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), nullable=False, default=datetime.now)
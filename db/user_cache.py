@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from db.database import session_factory_async
+from db.models import Users
+from db.user_cache_keys import INVALIDATE_CHANNEL, PREFIX, REDIS_TTL, VERSION_PREFIX, queue_invalidation
+from redis_client.client_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Локальный уровень живёт недолго: даже если инвалидация не дошла, данные быстро обновятся
+LOCAL_TTL = 60
+LOCAL_SIZE = 10000
+# Пользователя нет в БД — помним это недолго, чтобы не ходить в БД на каждый клик
+MISSING_TTL = 60
+MISSING = {"missing": "1"}
+# Переподключение слушателя инвалидаций: от секунды до минуты
+LISTEN_BACKOFF = (1, 60)
+
+# Заполняет хэш, только если поколение не изменилось с момента чтения:
+# инвалидация между чтением из БД и записью в кэш не даст записать устаревший профиль.
+# KEYS: хэш профиля, поколение; ARGV: прочитанное поколение ('' — не было), TTL, поля и значения
+FILL_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+_fill = redis_client.register_script(FILL_SCRIPT)
+
+
+class LRUCache:
+    """
+    Простой LRU с временем жизни записей для одного процесса.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def pop(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+local_cache = LRUCache(LOCAL_SIZE, LOCAL_TTL)
+stats = {"local_hit": 0, "redis_hit": 0, "miss": 0}
+
+
+def _decode(raw: dict) -> dict | None:
+    profile = {k.decode(): v.decode() for k, v in raw.items()}
+    if profile.get("missing"):
+        return None
+    profile["user_id"] = int(profile["user_id"])
+    profile["download_limit"] = int(profile["download_limit"]) if profile.get("download_limit") else None
+    return profile
+
+
+async def _load_from_db(user_id: int) -> dict | None:
+    async with session_factory_async() as session:
+        query = select(Users.user_id, Users.user_name, Users.status, Users.download_limit).where(
+            Users.user_id == user_id
+        )
+        row = (await session.execute(query)).one_or_none()
+    if not row:
+        return None
+    return {
+        "user_id": row.user_id,
+        "user_name": row.user_name or "",
+        "status": row.status,
+        "download_limit": row.download_limit,
+    }
+
+
+async def get_profile(user_id: int) -> dict | None:
+    """
+    Профиль пользователя (user_id, user_name, status, download_limit) через LRU процесса и хэш в Redis.
+    Возвращает None, если пользователя нет.
+    """
+    cached = local_cache.get(user_id)
+    if cached is not None:
+        stats["local_hit"] += 1
+        return cached or None
+
+    key = f"{PREFIX}{user_id}"
+    version_key = f"{VERSION_PREFIX}{user_id}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(key)
+    pipe.get(version_key)
+    raw, version = await pipe.execute()
+    if raw:
+        stats["redis_hit"] += 1
+        profile = _decode(raw)
+        local_cache.set(user_id, profile or {})
+        return profile
+
+    stats["miss"] += 1
+    profile = await _load_from_db(user_id)
+    mapping = {k: "" if v is None else v for k, v in profile.items()} if profile else MISSING
+    args = [version or "", REDIS_TTL if profile else MISSING_TTL]
+    for field, value in mapping.items():
+        args += [field, value]
+    # Пока читали БД, профиль могли изменить: тогда кэш не заполняем, следующий запрос прочитает заново
+    if await _fill(keys=[key, version_key], args=args):
+        local_cache.set(user_id, profile or {})
+    return profile
+
+
+async def invalidate(user_id: int):
+    """
+    Сбрасывает профиль во всех процессах: хэш в Redis и локальные LRU через pub/sub.
+    """
+    await invalidate_many([user_id])
+
+
+async def invalidate_many(user_ids: list[int]):
+    """
+    Пакетный сброс профилей одним пайплайном.
+    """
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        local_cache.pop(user_id)
+    pipe = redis_client.pipeline()
+    queue_invalidation(pipe, user_ids)
+    await pipe.execute()
+
+
+async def listen_invalidations():
+    """
+    Слушает инвалидации из других процессов и чистит локальный LRU.
+    При обрыве соединения переподписывается с растущей паузой.
+    """
+    delay = LISTEN_BACKOFF[0]
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            # Пока не были подписаны, инвалидации могли пройти мимо
+            local_cache.clear()
+            delay = LISTEN_BACKOFF[0]
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    try:
+                        local_cache.pop(int(message["data"]))
+                    except ValueError:
+                        logger.warning(f"Некорректная инвалидация профиля: {message['data']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Подписка на инвалидации профилей оборвалась, повтор через {delay} с: {e}")
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LISTEN_BACKOFF[1])
+
+
+def hit_ratio() -> dict:
+    total = sum(stats.values())
+    hits = stats["local_hit"] + stats["redis_hit"]
+    return {**stats, "ratio": hits / total if total else 0.0}
@@ -0,0 +1,23 @@
+"""
+Ключи кэша профилей и инвалидация без зависимостей бота:
+модуль импортирует и админка Django, которой не нужны движок БД и метрики.
+"""
+
+PREFIX = "user:"
+# Поколение профиля: растёт при каждой инвалидации, заполнение кэша со старым поколением отбрасывается
+VERSION_PREFIX = "user_ver:"
+INVALIDATE_CHANNEL = "user_cache:invalidate"
+REDIS_TTL = 3600
+
+
+def queue_invalidation(pipe, user_ids):
+    """
+    Добавляет в пайплайн (синхронный или асинхронный) сброс профилей user_ids:
+    удаление хэша, новое поколение и сообщение для локальных LRU других процессов.
+    """
+    pipe.delete(*[f"{PREFIX}{user_id}" for user_id in user_ids])
+    for user_id in user_ids:
+        pipe.incr(f"{VERSION_PREFIX}{user_id}")
+        # Поколение должно пережить любое заполнение, начатое до инвалидации
+        pipe.expire(f"{VERSION_PREFIX}{user_id}", REDIS_TTL)
+        pipe.publish(INVALIDATE_CHANNEL, user_id)
@@ -0,0 +1,80 @@
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+
+from db.ORM import DataBase
+from redis_client.client_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+SENT_LINKS_KEY = "wb:sent_links"
+DOWNLOADS_KEY = "wb:downloads"
+# Суффиксы пачки, снятой на запись в БД
+FLUSHING = ":flushing"
+BATCH_ID = ":flushing:id"
+
+# Забирает накопленный буфер в "пачку" с постоянным id.
+# Если с прошлого раза осталась незавершённая пачка — возвращает её же (тот же id).
+TAKE_BATCH_SCRIPT = """
+local batch_id = redis.call('GET', KEYS[3])
+if batch_id then
+    return batch_id
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SET', KEYS[3], ARGV[1])
+return ARGV[1]
+"""
+
+_take_batch = redis_client.register_script(TAKE_BATCH_SCRIPT)
+
+
+async def incr_sent_links(user_id: int, amount: int = 1):
+    """
+    Копит прирост счётчика отправленных ссылок в Redis вместо UPDATE на каждый клик.
+    """
+    await redis_client.hincrby(SENT_LINKS_KEY, user_id, amount)
+
+
+async def log_download(user_id: int, url_orig: str):
+    """
+    Копит факт скачивания в Redis; в таблицу downloads он попадёт при следующем сбросе.
+    """
+    await redis_client.rpush(DOWNLOADS_KEY, json.dumps([user_id, url_orig, time.time()]))
+
+
+async def _take(key: str) -> str | None:
+    batch_id = await _take_batch(keys=[key, key + FLUSHING, key + BATCH_ID], args=[uuid.uuid4().hex])
+    return batch_id.decode() if batch_id else None
+
+
+async def flush():
+    """
+    Переносит накопленное в Postgres. Безопасно при сбоях:
+    пачка удаляется из Redis только после коммита, а повторное применение
+    той же пачки отсекается по её id в таблице write_behind_batches.
+    """
+    sent_links_batch = await _take(SENT_LINKS_KEY)
+    if sent_links_batch:
+        raw = await redis_client.hgetall(SENT_LINKS_KEY + FLUSHING)
+        sent_links = {int(user_id): int(delta) for user_id, delta in raw.items()}
+        applied = await DataBase.apply_write_behind(f"sent_links:{sent_links_batch}", sent_links, [])
+        await redis_client.delete(SENT_LINKS_KEY + FLUSHING, SENT_LINKS_KEY + BATCH_ID)
+        logger.info(f"Сброшены счётчики ссылок: {len(sent_links)} пользователей"
+                    f"{'' if applied else ' (пачка уже была применена)'}")
+
+    downloads_batch = await _take(DOWNLOADS_KEY)
+    if downloads_batch:
+        raw = await redis_client.lrange(DOWNLOADS_KEY + FLUSHING, 0, -1)
+        downloads = []
+        for item in raw:
+            user_id, url_orig, ts = json.loads(item)
+            downloads.append((user_id, url_orig, datetime.fromtimestamp(ts)))
+        applied = await DataBase.apply_write_behind(f"downloads:{downloads_batch}", {}, downloads)
+        await redis_client.delete(DOWNLOADS_KEY + FLUSHING, DOWNLOADS_KEY + BATCH_ID)
+        logger.info(f"Записаны скачивания: {len(downloads)}"
+                    f"{'' if applied else ' (пачка уже была применена)'}")
@@ -5,14 +5,19 @@ import os
 from aiogram import Router, types, F, Bot
 from aiogram.filters import CommandStart, Command
 from aiogram.types import FSInputFile, CallbackQuery
+from celery_app import video_cache
 from celery_app.tasks import download_and_upload_video, parse_youtube_formats
+from db import user_cache, write_behind
+from redis_client import job_timeline, single_flight
 from redis_client.client_redis import redis_client
-from utils.check_limit import can_download
-from utils.trottle import del_throttle, check_throttle
+from scheduler.progress import register_status_message
+from utils.check_limit import get_download_limit
+from utils.func import extract_video_id
+from utils.rate_limit import (THROTTLE_PREFIX, acquire, check_throttle, download_quota_rule, refund_download,
+                              release_throttle_async, throttle_rule)
 from db.ORM import DataBase
-from config_data.config import ConfigEnv, load_config
+from config_data.config import get_config
 
-config: ConfigEnv = load_config()
 
 router = Router()
 
@@ -48,7 +53,7 @@ async def supports_handler(message: types.Message):
 
 @router.message(Command("reset_redis"))
 async def reset_redis_handler(message: types.Message):
-    if message.from_user.id not in config.tg_bot.admin_ids:
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
         await message.reply("У вас нет прав для выполнения этой команды.")
         return
 
@@ -60,9 +65,8 @@ async def reset_redis_handler(message: types.Message):
         target_user_id = message.from_user.id
 
     patterns = [
-        f"throttle:{target_user_id}:*",
-        f"downloads:{target_user_id}",
-        f"s3||result||{target_user_id}||*",
+        f"{THROTTLE_PREFIX}{target_user_id}:*",
+        f"quota:downloads:{target_user_id}",
         f"yt:{target_user_id}:*",
     ]
 
@@ -77,6 +81,35 @@ async def reset_redis_handler(message: types.Message):
         f"Сброшено {deleted} ключей Redis для пользователя {target_user_id}."
     )
 
+@router.message(Command("cache_stats"))
+async def cache_stats_handler(message: types.Message):
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
+        await message.reply("У вас нет прав для выполнения этой команды.")
+        return
+
+    users = user_cache.hit_ratio()
+    videos = video_cache.cache_stats()
+    await message.reply(
+        "📊 Кэши\n\n"
+        f"Профили: {users['ratio'] * 100:.1f}% попаданий "
+        f"(LRU {users['local_hit']}, Redis {users['redis_hit']}, БД {users['miss']})\n"
+        f"Метаданные видео: {videos['ratio'] * 100:.1f}% попаданий "
+        f"({videos['hit']} / {videos['hit'] + videos['miss']})"
+    )
+
+@router.message(Command("latency"))
+async def latency_handler(message: types.Message):
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
+        await message.reply("У вас нет прав для выполнения этой команды.")
+        return
+
+    reports = [
+        job_timeline.format_report(flow, await job_timeline.report(flow))
+        for flow in (job_timeline.PROBE, job_timeline.DOWNLOAD)
+    ]
+    await message.reply("⏱ Задержки по этапам (последние задачи)\n\n<pre>" + "\n\n".join(reports) + "</pre>",
+                        parse_mode="HTML")
+
 @router.message(lambda m: "youtu" in m.text)
 async def on_youtube_link(message: types.Message):
     try:
@@ -86,8 +119,11 @@ async def on_youtube_link(message: types.Message):
         url = message.text.strip()
         user_id = message.from_user.id
 
-        # Кидаем задачу в Celery
-        parse_youtube_formats.delay(user_id, url)
+        # Кидаем задачу в Celery; cid связывает этапы от ссылки до кнопок с форматами
+        cid = await job_timeline.start(job_timeline.PROBE)
+        # queued отмечаем до отправки: быстрый воркер может успеть записать started раньше
+        await job_timeline.mark(cid, "queued")
+        parse_youtube_formats.delay(user_id, url, cid=cid)
         await message.reply("🔍 Обрабатываю ссылку... Тут появятся кнопки с форматами, как только всё будет готово!")
 
     except Exception as e:
@@ -104,40 +140,55 @@ async def on_youtube_link(message: types.Message):
 @router.callback_query(F.data.startswith("dl|"))
 async def on_download_click(callback: CallbackQuery, bot: Bot):
     user_id = callback.from_user.id
+    # Попытка списана, но задача ещё не поставлена и не ждёт чужой — при ошибке её надо вернуть
+    charged = False
 
 
     try:
-        if not await can_download(user_id):
-            await callback.message.answer(
-                "❗️ Вы превысили лимит скачиваний на сегодня.\n\n"
-                "Чтобы получить больше скачиваний, напишите в поддержку — @Raymond_send 😊"
-            )
-
-            return
-        if await check_throttle(callback.from_user.id, 'dl', 600):
-            await callback.message.answer("⏳ Уже скачивается. Подожди завершения.")
-            return
-
-
         _, format_id = callback.data.split("|")
         redis_key = f"yt:{callback.from_user.id}:{format_id}"
         url_bytes = await redis_client.get(redis_key)
         url = url_bytes.decode() if url_bytes else None
 
-
-
         if not url:
             await callback.message.answer("❌ Ссылка устарела или не найдена.")
             return
-        # print(url)
-        task = download_and_upload_video.delay(url, callback.data, user_id)
 
-        await callback.message.answer("📥 Скачиваю...\n\nЯ пришлю ссылку, как только оно будет готово.")
+        # Лимит скачиваний и блокировка параллельного скачивания — одной атомарной проверкой
+        limit = await get_download_limit(user_id)
+        quota_rule = download_quota_rule(user_id, limit or 0)
+        rejected = await acquire(quota_rule, throttle_rule(user_id, 'dl', 600))
+        if rejected == quota_rule:
+            await callback.message.answer(
+                "❗️ Вы превысили лимит скачиваний на сегодня.\n\n"
+                "Чтобы получить больше скачиваний, напишите в поддержку — @Raymond_send 😊"
+            )
+            return
+        if rejected:
+            await callback.message.answer("⏳ Уже скачивается. Подожди завершения.")
+            return
+        charged = True
+
+        # Если этот формат уже кто-то качает — просто ждём его результат
+        video_id = extract_video_id(url)
+        cid = await job_timeline.start(job_timeline.DOWNLOAD)
+        flight = await single_flight.join(video_id, format_id, user_id, url, cid)
+        if flight:
+            await job_timeline.mark(cid, "queued")
+            download_and_upload_video.delay(url, callback.data, user_id, cid=cid, flight=flight)
+        # Дальше попытку и блокировку отпустит задача, когда раздаст результат
+        charged = False
+
+        status = await callback.message.answer("📥 Скачиваю...\n\nЯ пришлю ссылку, как только оно будет готово.")
+        await register_status_message(f"{video_id}:{format_id}", user_id, status.message_id)
 
-        await DataBase.increment_sent_links(user_id)
+        await write_behind.incr_sent_links(user_id)
 
 
     except Exception as e:
         logging.exception(f"Ошибка скачивания: {e}")
+        if charged:
+            await refund_download(user_id)
+            await release_throttle_async(user_id, 'dl')
         await callback.message.answer("❌ Не удалось скачать выбранный формат.")
 
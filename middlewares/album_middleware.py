@@ -1,58 +1,101 @@
 import asyncio
-from typing import Any, Dict, Union
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Union
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
+logger = logging.getLogger(__name__)
+
+# Больше 10 сообщений в медиагруппе Telegram не присылает
+MAX_ALBUM_SIZE = 10
+
+
+class _Album:
+    __slots__ = ("messages", "event", "handler", "data", "created", "timer")
+
+    def __init__(self):
+        self.messages: list[Message] = []
+        self.event = None
+        self.handler = None
+        self.data = None
+        self.created = time.monotonic()
+        self.timer: asyncio.TimerHandle | None = None
+
 
 class AlbumMiddleware(BaseMiddleware):
-    def __init__(self, latency: Union[int, float] = 0.1, admin_ids: list=None):
-        # Initialize latency and album_data dictionary
+    """
+    Собирает сообщения одной медиагруппы и вызывает обработчик один раз
+    со всем альбомом в data["album"] (по возрастанию message_id).
+
+    На каждую группу один таймер: очередное сообщение переносит его на latency секунд.
+    Когда таймер срабатывает, группа удаляется из буфера. Буфер ограничен:
+    не больше max_albums групп одновременно, и группа не копится дольше ttl секунд.
+    """
+
+    def __init__(self, latency: Union[int, float] = 0.1, admin_ids: list = None,
+                 ttl: float = 10.0, max_albums: int = 1000):
         self.latency = latency
-        self.album_data = {}
+        self.ttl = ttl
+        self.max_albums = max_albums
         self.admin_ids = admin_ids if admin_ids else []
-#
-    def collect_album_messages(self, event: Message):
-        """
-        Collect messages of the same media group.
-        """
-#         # Check if media_group_id exists in album_data
-        if event.media_group_id not in self.album_data:
-#             # Create a new entry for the media group
-            self.album_data[event.media_group_id] = {"messages": []}
-#
-#         # Append the new message to the media group
-        self.album_data[event.media_group_id]["messages"].append(event)
-#
-#         # Return the total number of messages in the current media group
-        return len(self.album_data[event.media_group_id]["messages"])
-#
-    async def __call__(self, handler, event: Message, data: Dict[str, Any]) -> Any:
-        """
-        Main middlewares logic.
-        """
-#         # If the event has no media_group_id, pass it to the handler immediately
+        self.album_data: dict[str, _Album] = {}
+        # Ссылки на запущенные обработчики, чтобы задачи не собрал GC
+        self.tasks: set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
         if not event.media_group_id:
             return await handler(event, data)
-#
-#         # Collect messages of the same media group
-        total_before = self.collect_album_messages(event)
-#
-#         # Wait for a specified latency period
-        await asyncio.sleep(self.latency)
-#
-#         # Check the total number of messages after the latency
-        total_after = len(self.album_data[event.media_group_id]["messages"])
-#
-#         # If new messages were added during the latency, exit
-        if total_before != total_after:
+
+        album = self.album_data.get(event.media_group_id)
+        if album is None:
+            if len(self.album_data) >= self.max_albums:
+                self._evict_oldest()
+            album = self.album_data[event.media_group_id] = _Album()
+
+        # Обработчик вызывается с последним пришедшим сообщением, как и раньше
+        album.messages.append(event)
+        album.event = event
+        album.handler = handler
+        album.data = data
+        if album.timer:
+            album.timer.cancel()
+
+        if len(album.messages) >= MAX_ALBUM_SIZE or time.monotonic() - album.created >= self.ttl:
+            self._fire(event.media_group_id)
+        else:
+            album.timer = asyncio.get_running_loop().call_later(self.latency, self._fire, event.media_group_id)
+
+    def _fire(self, media_group_id: str):
+        album = self.album_data.pop(media_group_id, None)
+        if album is None:
             return
-#
-#         # Sort the album messages by message_id and add to data
-        album_messages = self.album_data[event.media_group_id]["messages"]
-        album_messages.sort(key=lambda x: x.message_id)
-        data["album"] = album_messages
-
-        
-        return await handler(event, data)
-#
\ No newline at end of file
+        if album.timer:
+            album.timer.cancel()
+        album.messages.sort(key=lambda x: x.message_id)
+        album.data["album"] = album.messages
+
+        task = asyncio.create_task(self._run(album.handler, album.event, album.data))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    @staticmethod
+    async def _run(handler, event: Message, data: Dict[str, Any]):
+        try:
+            await handler(event, data)
+        except Exception as e:
+            logger.error(f"Ошибка обработки медиагруппы {event.media_group_id}: {e}", exc_info=True)
+
+    def _evict_oldest(self):
+        # Словарь хранит порядок вставки — первая группа самая старая
+        media_group_id = next(iter(self.album_data))
+        album = self.album_data.pop(media_group_id)
+        if album.timer:
+            album.timer.cancel()
+        logger.warning(f"Буфер альбомов переполнен, медиагруппа {media_group_id} отброшена")
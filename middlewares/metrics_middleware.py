@@ -0,0 +1,28 @@
+import time
+
+from aiogram import BaseMiddleware
+
+from utils.metrics import HANDLER_LATENCY
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Время обработчиков роутера в метрику bot_handler_seconds.
+    Вешается на router.<event>.middleware(), поэтому считает только события,
+    для которых в роутере нашёлся обработчик.
+    """
+
+    def __init__(self, router: str, event: str):
+        self.router = router
+        self.event = event
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            HANDLER_LATENCY.labels(self.router, self.event, status).observe(time.perf_counter() - started)
@@ -1,9 +1,58 @@
+import functools
+import time
+
 import redis.asyncio as redis
-from config_data.config import ConfigEnv, load_config
+from config_data.config import get_config
 from redis import Redis
+from utils.metrics import REDIS_LATENCY
+
+# Блокирующие чтения ждут данных секундами — в задержку команд их не записываем
+BLOCKING_COMMANDS = {"XREADGROUP", "XREAD", "BLPOP", "BRPOP", "BLMOVE", "BZPOPMIN", "BZPOPMAX"}
+
+
+def _observe(command, started: float):
+    name = command.upper() if isinstance(command, str) else str(command)
+    if name not in BLOCKING_COMMANDS:
+        REDIS_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class TimedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _observe(args[0], started)
+
+
+class TimedSyncRedis(Redis):
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            _observe(args[0], started)
+
+
+def _connection_options() -> dict:
+    redis = get_config().redis
+    return {"host": redis.host, "port": redis.port, "password": redis.password, "db": redis.db}
+
+
+@functools.cache
+def get_redis_client() -> TimedRedis:
+    return TimedRedis(**_connection_options())
+
 
-config: ConfigEnv = load_config()
+@functools.cache
+def get_sync_redis() -> TimedSyncRedis:
+    return TimedSyncRedis(**_connection_options())
 
-redis_client = redis.Redis(host=config.redis.host, port=config.redis.port, password=config.redis.password)
 
-sync_redis = Redis(host=config.redis.host, port=config.redis.port, password=config.redis.password)
\ No newline at end of file
+def __getattr__(name: str):
+    # Клиенты создаются при первом обращении, а не при импорте модуля
+    if name == "redis_client":
+        return get_redis_client()
+    if name == "sync_redis":
+        return get_sync_redis()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
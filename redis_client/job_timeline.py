@@ -0,0 +1,185 @@
+"""
+Сквозная хронология задач: у каждого запроса пользователя свой correlation ID (cid),
+и каждый этап пишет в Redis момент своего завершения.
+
+    timeline:{cid}       hash  stage -> unix-время в мс (+ flow)
+    timelines:{flow}     zset  cid -> время доставки, последние KEEP завершённых
+
+Отчёт p50/p95 по переходам между этапами:
+
+    uv run python -m redis_client.job_timeline --flow download
+"""
+import argparse
+import time
+import uuid
+
+from redis_client.client_redis import redis_client, sync_redis
+
+PREFIX = "timeline:"
+INDEX_PREFIX = "timelines:"
+TTL = 24 * 3600
+# Сколько последних завершённых задач держим для отчёта
+KEEP = 5000
+
+PROBE = "probe"
+DOWNLOAD = "download"
+
+# Этапы в порядке прохождения; у конкретной задачи часть может отсутствовать
+# (готовый объект в S3, ожидание чужого скачивания, потоковая загрузка без fetched)
+STAGES = (
+    "received",   # обработчик бота получил ссылку / нажатие
+    "queued",     # задача отправлена в Celery
+    "started",    # воркер взял задачу
+    "probed",     # метаданные видео получены
+    "fetched",    # файл скачан на диск
+    "uploaded",   # объект загружен в S3
+    "published",  # результат записан в стрим
+    "picked",     # бот прочитал результат из стрима
+    "delivered",  # сообщение пользователю отправлено
+)
+
+
+# Этап пишется только в существующую хронологию: после истечения TTL запоздавшая
+# отметка не должна создать ключ без срока жизни
+MARK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+_mark = redis_client.register_script(MARK_SCRIPT)
+_mark_sync = sync_redis.register_script(MARK_SCRIPT)
+
+
+def new_cid() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def start(flow: str) -> str:
+    """
+    Заводит хронологию новой задачи, отмечая received. Возвращает cid.
+    """
+    cid = new_cid()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(f"{PREFIX}{cid}", mapping={"flow": flow, "received": _now_ms()})
+    pipe.expire(f"{PREFIX}{cid}", TTL)
+    await pipe.execute()
+    return cid
+
+
+async def mark(cid: str | None, stage: str):
+    if not cid:
+        return
+    await _mark(keys=[f"{PREFIX}{cid}"], args=[stage, _now_ms()])
+
+
+def mark_sync(cid: str | None, stage: str):
+    """
+    То же для Celery-воркера. Ошибки не пробрасываются: хронология не повод ронять задачу.
+    """
+    if not cid:
+        return
+    try:
+        _mark_sync(keys=[f"{PREFIX}{cid}"], args=[stage, _now_ms()])
+    except Exception:
+        pass
+
+
+async def finish(cid: str | None):
+    """
+    Отмечает доставку и добавляет задачу в выборку для отчёта.
+    """
+    if not cid:
+        return
+    key = f"{PREFIX}{cid}"
+    now = _now_ms()
+    flow = await redis_client.hget(key, "flow")
+    if not flow:
+        return
+    index = f"{INDEX_PREFIX}{flow.decode()}"
+    pipe = redis_client.pipeline(transaction=False)
+    await _mark(keys=[key], args=["delivered", now], client=pipe)
+    pipe.zadd(index, {cid: now})
+    pipe.zremrangebyrank(index, 0, -KEEP - 1)
+    await pipe.execute()
+
+
+def _intervals(timeline: dict) -> dict[str, int]:
+    """
+    Длительности переходов между соседними отмеченными этапами, плюс total.
+    """
+    marks = [(stage, int(timeline[stage])) for stage in STAGES if stage in timeline]
+    result = {f"{a}→{b}": tb - ta for (a, ta), (b, tb) in zip(marks, marks[1:])}
+    if len(marks) > 1:
+        result["total"] = marks[-1][1] - marks[0][1]
+    return result
+
+
+def _percentile(samples: list[int], q: float) -> int:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def _summarize(timelines: list[dict]) -> dict[str, dict]:
+    samples: dict[str, list[int]] = {}
+    for timeline in timelines:
+        for name, value in _intervals(timeline).items():
+            samples.setdefault(name, []).append(value)
+
+    order = {f"{a}→{b}": (STAGES.index(a), STAGES.index(b)) for a in STAGES for b in STAGES}
+    names = sorted((n for n in samples if n != "total"), key=lambda n: order[n])
+    if "total" in samples:
+        names.append("total")
+    return {
+        name: {"n": len(samples[name]), "p50": _percentile(samples[name], 0.5),
+               "p95": _percentile(samples[name], 0.95)}
+        for name in names
+    }
+
+
+def _decode(raw: dict) -> dict:
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+async def report(flow: str, limit: int = 1000) -> dict[str, dict]:
+    """
+    p50/p95 (мс) по переходам для последних limit доставленных задач flow.
+    """
+    cids = await redis_client.zrevrange(f"{INDEX_PREFIX}{flow}", 0, limit - 1)
+    pipe = redis_client.pipeline(transaction=False)
+    for cid in cids:
+        pipe.hgetall(f"{PREFIX}{cid.decode()}")
+    return _summarize([_decode(raw) for raw in await pipe.execute() if raw])
+
+
+def report_sync(flow: str, limit: int = 1000) -> dict[str, dict]:
+    cids = sync_redis.zrevrange(f"{INDEX_PREFIX}{flow}", 0, limit - 1)
+    pipe = sync_redis.pipeline(transaction=False)
+    for cid in cids:
+        pipe.hgetall(f"{PREFIX}{cid.decode()}")
+    return _summarize([_decode(raw) for raw in pipe.execute() if raw])
+
+
+def format_report(flow: str, summary: dict[str, dict]) -> str:
+    if not summary:
+        return f"{flow}: нет данных"
+    lines = [f"{flow}: {summary.get('total', {}).get('n', 0)} задач"]
+    for name, stats in summary.items():
+        lines.append(f"  {name:<22} n={stats['n']:<5} p50 {stats['p50'] / 1000:7.2f} с   "
+                     f"p95 {stats['p95'] / 1000:7.2f} с")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p95 по этапам обработки ссылок и скачиваний")
+    parser.add_argument("--flow", choices=(PROBE, DOWNLOAD), action="append")
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+    for flow in args.flow or (PROBE, DOWNLOAD):
+        print(format_report(flow, report_sync(flow, args.limit)))
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import socket
+
+from redis.exceptions import ResponseError
+
+from redis_client import job_timeline
+from redis_client.client_redis import redis_client, sync_redis
+from utils.metrics import observe_stream_delivery
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "bot:results"
+# Прогресс пишется часто и его потеря не страшна — держим отдельно, чтобы он не вытеснял результаты
+PROGRESS_STREAM_KEY = "bot:progress"
+GROUP = "bot"
+# Примерная длина хвоста стрима: доставленные записи дальше не нужны
+MAXLEN = 10000
+PROGRESS_MAXLEN = 2000
+BLOCK_MS = 5000
+BATCH = 50
+# Записи, не подтверждённые дольше этого времени, забираем у упавших потребителей
+CLAIM_IDLE_MS = 60000
+CLAIM_EVERY = 30
+# Запись, обработчик которой падал столько раз, подтверждаем без доставки
+MAX_DELIVERIES = 5
+# Потребители прошлых запусков (имя host-pid) без незабранных записей удаляются из группы
+CONSUMER_IDLE_MS = 10 * 60 * 1000
+
+
+def publish(kind: str, user_id: int, url: str, value: str, stream: str = STREAM_KEY, maxlen: int = MAXLEN,
+            cid: str | None = None, job: str | None = None):
+    """
+    Публикует результат Celery-задачи для бота (вызывается из воркера).
+    cid — correlation ID задачи: бот по нему отметит получение и доставку в хронологии.
+    job — задача скачивания ("<video_id>:<format_id>"): бот закроет её статусное сообщение.
+    """
+    fields = {"kind": kind, "user_id": user_id, "url": url, "value": value}
+    if cid:
+        fields["cid"] = cid
+        job_timeline.mark_sync(cid, "published")
+    if job:
+        fields["job"] = job
+    sync_redis.xadd(stream, fields, maxlen=maxlen, approximate=True)
+
+
+def publish_progress(user_id: int, job: str, value: str):
+    publish("progress", user_id, job, value, stream=PROGRESS_STREAM_KEY, maxlen=PROGRESS_MAXLEN)
+
+
+async def _ensure_group(stream: str):
+    try:
+        await redis_client.xgroup_create(stream, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _deliveries(stream: str, entry_id) -> int:
+    pending = await redis_client.xpending_range(stream, GROUP, min=entry_id, max=entry_id, count=1)
+    return pending[0]["times_delivered"] if pending else MAX_DELIVERIES
+
+
+async def _handle(stream: str, entry_id, fields: dict, handlers: dict):
+    fields = {k.decode(): v.decode() for k, v in fields.items()}
+    handler = handlers.get(fields.get("kind"))
+    observe_stream_delivery(stream, fields.get("kind", "unknown"), entry_id)
+    cid = fields.get("cid")
+    try:
+        if handler:
+            await job_timeline.mark(cid, "picked")
+            extra = {"job": fields["job"]} if "job" in fields else {}
+            delivered = await handler(int(fields["user_id"]), fields["url"], fields["value"], entry_id, **extra)
+            # False — обработчик не смог отправить результат (и сам сообщил об ошибке)
+            if delivered is not False:
+                await job_timeline.finish(cid)
+        else:
+            logger.warning(f"Неизвестный тип записи {entry_id}: {fields}")
+    except Exception as e:
+        logger.exception(f"Ошибка обработки записи {entry_id}: {e}")
+        if await _deliveries(stream, entry_id) < MAX_DELIVERIES:
+            # Не подтверждаем: запись останется в PEL, и XAUTOCLAIM отдаст её повторно
+            return
+        logger.error(f"Запись {entry_id} не обработана за {MAX_DELIVERIES} попыток, отбрасываем")
+    await redis_client.xack(stream, GROUP, entry_id)
+
+
+async def _claim_stale(stream: str, consumer: str, handlers: dict):
+    """
+    Забирает все записи, зависшие у упавших потребителей (и повторы после ошибок),
+    проходя курсор XAUTOCLAIM до конца.
+    """
+    start_id = "0-0"
+    while True:
+        start_id, claimed, *_ = await redis_client.xautoclaim(
+            stream, GROUP, consumer, min_idle_time=CLAIM_IDLE_MS, start_id=start_id, count=BATCH
+        )
+        for entry_id, fields in claimed:
+            if fields:
+                await _handle(stream, entry_id, fields, handlers)
+        if start_id in (b"0-0", "0-0"):
+            return
+
+
+async def _prune_consumers(stream: str, consumer: str):
+    """
+    Удаляет из группы потребителей прошлых запусков: без записей в PEL и давно не читавших.
+    """
+    for info in await redis_client.xinfo_consumers(stream, GROUP):
+        name = info["name"].decode() if isinstance(info["name"], bytes) else info["name"]
+        if name != consumer and info["pending"] == 0 and info["idle"] > CONSUMER_IDLE_MS:
+            await redis_client.xgroup_delconsumer(stream, GROUP, name)
+            logger.info(f"Удалён неактивный потребитель {name} из {stream}")
+
+
+async def consume(handlers: dict, stream: str = STREAM_KEY, consumer: str | None = None):
+    """
+    Бесконечно читает стрим результатов через consumer group.
+    handlers: kind -> async (user_id, url, value, entry_id[, job]); False в ответ — результат не доставлен.
+    """
+    consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+    await _ensure_group(stream)
+    loop = asyncio.get_running_loop()
+    next_claim = 0.0
+
+    while True:
+        try:
+            if loop.time() >= next_claim:
+                # Записи, которые взял и не подтвердил упавший процесс или не смог обработать этот
+                await _claim_stale(stream, consumer, handlers)
+                await _prune_consumers(stream, consumer)
+                next_claim = loop.time() + CLAIM_EVERY
+
+            response = await redis_client.xreadgroup(
+                GROUP, consumer, {stream: ">"}, count=BATCH, block=BLOCK_MS
+            )
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    await _handle(stream, entry_id, fields, handlers)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Ошибка чтения стрима результатов: {e}")
+            await asyncio.sleep(1)
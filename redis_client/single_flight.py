@@ -0,0 +1,116 @@
+import json
+import logging
+import threading
+import uuid
+
+from redis_client.client_redis import redis_client, sync_redis
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_PREFIX = "inflight:"
+# Если воркер умер, не отпустив задачу, ожидающие освободятся по TTL.
+# Пока задача выполняется, воркер продлевает TTL (Heartbeat)
+FLIGHT_TTL = 1800
+HEARTBEAT_INTERVAL = FLIGHT_TTL // 6
+
+# Первый пришедший становится владельцем задачи, остальные — ожидающими.
+# Владелец тоже попадает в список, чтобы результат раздавался одним циклом.
+JOIN_SCRIPT = """
+local owner = redis.call('SET', KEYS[1], ARGV[2], 'NX', 'EX', ARGV[3])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if owner then
+    return 1
+end
+return 0
+"""
+
+# Забираем всех ожидающих и закрываем рейс одной атомарной операцией,
+# чтобы никто не успел встать в очередь к уже завершённой задаче.
+# Если рейсом уже владеет другая задача (наш ключ истёк), её ожидающих не трогаем
+RELEASE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and ARGV[1] ~= '' and owner ~= ARGV[1] then
+    return {}
+end
+local waiters = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return waiters
+"""
+
+# Продлевает рейс, только пока им владеет эта задача
+HEARTBEAT_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+_join = redis_client.register_script(JOIN_SCRIPT)
+_release = sync_redis.register_script(RELEASE_SCRIPT)
+_heartbeat = sync_redis.register_script(HEARTBEAT_SCRIPT)
+
+
+def _keys(video_id: str, format_id: str) -> list[str]:
+    base = f"{FLIGHT_PREFIX}{video_id}:{format_id}"
+    return [base, f"{base}:waiters"]
+
+
+async def join(video_id: str, format_id: str, user_id: int, url: str, cid: str | None = None) -> str | None:
+    """
+    Регистрирует пользователя на результат скачивания (video_id, format_id).
+    Если пользователь стал владельцем и задачу нужно поставить в Celery, возвращает
+    токен рейса — его получает задача для Heartbeat и release. Иначе None.
+    """
+    waiter = json.dumps({"user_id": user_id, "url": url, "cid": cid})
+    token = uuid.uuid4().hex
+    if await _join(keys=_keys(video_id, format_id), args=[waiter, token, FLIGHT_TTL]):
+        return token
+    return None
+
+
+def release(video_id: str, format_id: str, token: str | None = None) -> list[dict]:
+    """
+    Завершает рейс и возвращает всех, кто ждал результат (включая владельца).
+    Рейс другого владельца не закрывается — тогда список пуст.
+    """
+    return [json.loads(w) for w in _release(keys=_keys(video_id, format_id), args=[token or ""])]
+
+
+class Heartbeat:
+    """
+    Продлевает TTL рейса из фонового потока, пока задача работает:
+    ожидание места на диске и долгое скачивание не должны отпускать рейс по TTL.
+    """
+
+    def __init__(self, video_id: str, format_id: str, token: str | None):
+        self.keys = _keys(video_id, format_id)
+        self.token = token
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="flight-heartbeat", daemon=True)
+
+    def _beat(self) -> bool:
+        try:
+            return bool(_heartbeat(keys=self.keys, args=[self.token, FLIGHT_TTL]))
+        except Exception as e:
+            logger.warning(f"Не удалось продлить рейс {self.keys[0]}: {e}")
+            return True
+
+    def _run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            if not self._beat():
+                # Рейс уже закрыт или перешёл к другой задаче
+                return
+
+    def start(self) -> "Heartbeat":
+        # Задача без токена поставлена до обновления — продлевать нечего
+        if self.token and self._beat():
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,39 @@
+import logging
+
+from redis_client.client_redis import sync_redis
+from s3.s3_client import object_exists
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = "s3_index:"
+# Сколько держим запись индекса; должно быть не больше срока хранения объектов в бакете
+INDEX_TTL = 7 * 24 * 3600
+
+
+def content_key(video_id: str, format_id: str, ext: str) -> str:
+    """
+    Content-addressed ключ объекта: одно видео в одном формате хранится в бакете один раз.
+    """
+    return f"videos/{video_id}/{format_id}.{ext}"
+
+
+def lookup(video_id: str, format_id: str, ext: str) -> str | None:
+    """
+    Возвращает ключ уже загруженного объекта или None.
+    Индекс в Redis — быстрый путь, при промахе проверяем сам бакет.
+    """
+    index_key = f"{INDEX_PREFIX}{video_id}:{format_id}"
+    s3_key = sync_redis.get(index_key)
+    if s3_key:
+        return s3_key.decode()
+
+    s3_key = content_key(video_id, format_id, ext)
+    if object_exists(s3_key):
+        remember(video_id, format_id, s3_key)
+        return s3_key
+    return None
+
+
+def remember(video_id: str, format_id: str, s3_key: str):
+    sync_redis.set(f"{INDEX_PREFIX}{video_id}:{format_id}", s3_key, ex=INDEX_TTL)
+    logger.info(f"Объект {s3_key} добавлен в индекс")
@@ -1,42 +1,177 @@
 import logging
+import queue
+import threading
+import time
+from urllib.parse import quote
 
-import boto3
-from botocore.client import Config
-from config_data.config import ConfigEnv, load_config
+from config_data.config import get_config
+from utils.metrics import observe_s3_failure, observe_s3_upload
 
-config: ConfigEnv = load_config()
 logger = logging.getLogger(__name__)
 
 
-# Конфигурация S3 клиента
-s3_client = boto3.client(
-    's3',
-    config=Config(signature_version='s3v4'),
-    endpoint_url=config.s3.url,
-    aws_access_key_id=config.s3.key_id,
-    aws_secret_access_key=config.s3.key_secret,
-)
-def upload_to_s3(file_stream, file_name, bucket_name=config.s3.name, expiration=43200):
-    try:
-        s3_client.upload_fileobj(file_stream, bucket_name, file_name)
-        s3_url = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': file_name},
-                                                  ExpiresIn=expiration)
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Клиент S3 создаётся при первом обращении: boto3 долго импортируется,
+    а процессу бота он не нужен вовсе.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.client import Config
+
+                config = get_config()
+                _s3_client = boto3.client(
+                    's3',
+                    config=Config(signature_version='s3v4'),
+                    endpoint_url=config.s3.url,
+                    aws_access_key_id=config.s3.key_id,
+                    aws_secret_access_key=config.s3.key_secret,
+                )
+    return _s3_client
+
 
-        print(s3_url)
-        return s3_url
+def upload_to_s3(file_stream, file_name, bucket_name=None, expiration=43200, download_name=None,
+                 callback=None):
+    bucket_name = bucket_name or get_config().s3.name
+    try:
+        started = time.perf_counter()
+        get_s3_client().upload_fileobj(file_stream, bucket_name, file_name, Callback=callback)
+        observe_s3_upload("file", file_stream.tell(), time.perf_counter() - started)
+        return generate_presigned_s3_url(file_name, bucket_name, expiration, download_name)
 
     except Exception as e:
+        observe_s3_failure("file")
         logger.error(f"Error uploading file to S3: {e}")
         return None
 
-def generate_presigned_s3_url(file_name, bucket_name=config.s3.name, expiration=129600):  # 36 часов (129600 секунд)
+def generate_presigned_s3_url(file_name, bucket_name=None, expiration=129600, download_name=None):  # 36 часов (129600 секунд)
+    bucket_name = bucket_name or get_config().s3.name
     try:
-        url = s3_client.generate_presigned_url(
+        params = {'Bucket': bucket_name, 'Key': file_name}
+        if download_name:
+            # Объект лежит под content-addressed ключом, а пользователь получает файл с человеческим именем
+            params['ResponseContentDisposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        url = get_s3_client().generate_presigned_url(
             'get_object',
-            Params={'Bucket': bucket_name, 'Key': file_name},
+            Params=params,
             ExpiresIn=expiration
         )
         return url
     except Exception as e:
         logger.error(f"Error generating presigned URL: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def object_exists(file_name, bucket_name=None) -> bool:
+    from botocore.exceptions import ClientError
+
+    bucket_name = bucket_name or get_config().s3.name
+    try:
+        get_s3_client().head_object(Bucket=bucket_name, Key=file_name)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        logger.error(f"Error checking S3 object {file_name}: {e}")
+        return False
+
+
+class StreamingUpload:
+    """
+    Multipart-загрузка из потока без временного файла.
+    Прочитанные части кладутся в ограниченный буфер (очередь на buffer_parts частей),
+    а пул потоков отправляет их в S3, пока источник продолжает писать следующие.
+    Память ограничена примерно (buffer_parts + upload_workers + 1) * part_size.
+    """
+
+    def __init__(self, file_name, bucket_name=None, part_size=None, buffer_parts=None, upload_workers=None,
+                 callback=None):
+        # Не заданные явно параметры берутся из конфига
+        s3 = get_config().s3
+        bucket_name = bucket_name or s3.name
+        part_size = part_size or s3.part_size
+        buffer_parts = buffer_parts or s3.buffer_parts
+        upload_workers = upload_workers or s3.upload_workers
+        # S3 не принимает части меньше 5 МБ (кроме последней)
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.upload_workers = upload_workers
+        # Вызывается с числом прочитанных из потока байт, как Callback у boto3
+        self.callback = callback
+        self.buffer = queue.Queue(maxsize=buffer_parts)
+        self.etags = {}
+        self.errors = []
+        self.bytes_read = 0
+        self.started = time.perf_counter()
+        self.upload_id = get_s3_client().create_multipart_upload(Bucket=bucket_name, Key=file_name)['UploadId']
+
+    def _upload_worker(self):
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                return
+            number, body = item
+            if self.errors:
+                continue
+            try:
+                response = get_s3_client().upload_part(
+                    Bucket=self.bucket_name, Key=self.file_name, UploadId=self.upload_id,
+                    PartNumber=number, Body=body,
+                )
+                self.etags[number] = response['ETag']
+            except Exception as e:
+                self.errors.append(e)
+
+    def feed(self, stream) -> int:
+        """
+        Читает поток до EOF и загружает его частями. Возвращает число прочитанных байт
+        (0 для пустого потока — complete() тогда вызывать нельзя, решает вызывающий).
+        """
+        workers = [threading.Thread(target=self._upload_worker, daemon=True) for _ in range(self.upload_workers)]
+        for worker in workers:
+            worker.start()
+
+        number = 0
+        try:
+            while not self.errors:
+                body = stream.read(self.part_size)
+                if not body:
+                    break
+                number += 1
+                self.bytes_read += len(body)
+                if self.callback:
+                    self.callback(len(body))
+                # Блокируется, когда буфер полон — так источник не убегает вперёд загрузки
+                self.buffer.put((number, body))
+        finally:
+            for _ in workers:
+                self.buffer.put(None)
+            for worker in workers:
+                worker.join()
+
+        if self.errors:
+            raise self.errors[0]
+        return self.bytes_read
+
+    def complete(self):
+        get_s3_client().complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.file_name, UploadId=self.upload_id,
+            MultipartUpload={'Parts': [
+                {'ETag': etag, 'PartNumber': number} for number, etag in sorted(self.etags.items())
+            ]},
+        )
+        observe_s3_upload("stream", self.bytes_read, time.perf_counter() - self.started)
+
+    def abort(self):
+        observe_s3_failure("stream")
+        try:
+            get_s3_client().abort_multipart_upload(Bucket=self.bucket_name, Key=self.file_name, UploadId=self.upload_id)
+        except Exception as e:
+            logger.error(f"Error aborting multipart upload {self.file_name}: {e}")
@@ -1,93 +1,111 @@
+import asyncio
 import json
+import logging
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from db.ORM import DataBase
+from db import write_behind
+from redis_client import result_stream
 from redis_client.client_redis import redis_client
-from utils.check_limit import incr_download
+from scheduler.progress import ProgressEditor
+from utils.rate_limit import refund_download
+
+logger = logging.getLogger(__name__)
+
+progress_editor: ProgressEditor | None = None
+
 ERROR_MSG = ("❌ Произошла ошибка при загрузке видео.\n\n"
              "Пожалуйста, отправьте <b>прямую ссылку на видео</b>, например:\n"
              "https://youtu.be/VIDEO_ID\nили\nhttps://www.youtube.com/watch?v=VIDEO_ID\n\n"
              "⚠️ Ссылки на плейлисты, каналы или сборники не поддерживаются.")
 
-async def check_s3_results(bot: Bot):
-    keys = await redis_client.keys("s3||result||*")
-    for key in keys:
-        user_id = int(key.decode().split("||")[-2])
 
+async def deliver_s3_result(bot: Bot, user_id: int, url_orig: str, url: str, entry_id=None, job=None):
+    if progress_editor and job:
         try:
-            print(f"Получен кей: {key}")
-            print(f'USER_ID: {user_id}')
-            url_orig = key.decode().split("||")[-1]
-            url = await redis_client.get(key)
-            url = url.decode() if url else None
-
-            if url == "error":
-                await bot.send_message(user_id, ERROR_MSG, parse_mode='HTML')
-            elif url:
-                button = InlineKeyboardButton(text="🔗 Скачать видео", url=url)
-                markup = InlineKeyboardMarkup(inline_keyboard=[[button]])
-                await bot.send_message(
-                    user_id,
-                    f"✅ Готово! <a href='{url_orig}'>Твое видео готово к скачиванию.</a>\n"
-                    "Нажми на кнопку ниже, чтобы скачать файл.\n\n"
-                    "<b>Внимание:</b> ссылка будет действовать 12 часов!",
-                    reply_markup=markup,
-                    parse_mode='HTML'
-                )
-
-                await incr_download(user_id, url_orig)
-                await DataBase.log_download(user_id, url_orig)
-
-            await redis_client.delete(key)  # удаляем ключ, чтобы не повторялось
-
+            await progress_editor.finish(job, user_id)
         except Exception as e:
-            await redis_client.delete(key)
-            print(f'ERROR: send user: {key}, error: {e}')
-
+            # Без этого разве что лишний раз обновится прогресс — ссылку доставляем в любом случае
+            logger.warning(f"Не удалось закрыть прогресс {job} для {user_id}: {e}")
+    try:
+        logger.info(f"Получен результат {entry_id} для {user_id}: {url_orig}")
+
+        if url == "error":
+            # Попытка списана при нажатии на кнопку — неудачное скачивание лимит не тратит
+            await refund_download(user_id)
             await bot.send_message(user_id, ERROR_MSG, parse_mode='HTML')
-
-
-async def check_formats_ready(bot: Bot):
-    # Найти все ключи yt_formats:* (или по user_id)
-    keys = await redis_client.keys("yt_formats:*")
-    for key in keys:
-        key_str = key.decode() if isinstance(key, bytes) else key
-        parts = key_str.split(":")
-        user_id = int(parts[1])
-        try:
-
-            url = ":".join(parts[2:])
-            value = await redis_client.get(key)
-            value = value.decode() if value else None
-
-            if not value:
-                continue
-            if value == "error":
-                await bot.send_message(user_id, "❌ Не удалось получить форматы видео.")
-                await redis_client.delete(key)
-                continue
-
-            formats = json.loads(value)
-            if not formats:
-                await bot.send_message(user_id, "❌ Не удалось найти подходящие форматы.")
-                await redis_client.delete(key)
-                continue
-
-            buttons = []
-            for f in formats[:10]:
-                fid = f["format_id"]
-                filesize_mb = round(f["filesize"] / 1024 / 1024, 1)
-                label = f"{f.get('format_note') or ''} {f['ext']} - {filesize_mb}MB"
-                redis_key = f"yt:{user_id}:{fid}"
-                await redis_client.setex(redis_key, 3600, url)
-                buttons.append([InlineKeyboardButton(text=label.strip(), callback_data=f"dl|{fid}")])
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(user_id, "Выбери качество:", reply_markup=keyboard)
-
-            await redis_client.delete(key)
-        except Exception as e:
-            print(f"Ошибка при отправке форматов: {e}")
-            await redis_client.delete(key)
-            await bot.send_message(user_id, ERROR_MSG, parse_mode='HTML')
\ No newline at end of file
+        elif url:
+            button = InlineKeyboardButton(text="🔗 Скачать видео", url=url)
+            markup = InlineKeyboardMarkup(inline_keyboard=[[button]])
+            await bot.send_message(
+                user_id,
+                f"✅ Готово! <a href='{url_orig}'>Твое видео готово к скачиванию.</a>\n"
+                "Нажми на кнопку ниже, чтобы скачать файл.\n\n"
+                "<b>Внимание:</b> ссылка будет действовать 12 часов!",
+                reply_markup=markup,
+                parse_mode='HTML'
+            )
+
+            await write_behind.log_download(user_id, url_orig)
+        return True
+
+    except Exception as e:
+        logger.error(f'ERROR: send user: {user_id}, error: {e}')
+
+        await bot.send_message(user_id, ERROR_MSG, parse_mode='HTML')
+        # Результат пользователь не получил — в хронологии доставку не отмечаем
+        return False
+
+
+async def deliver_formats(bot: Bot, user_id: int, url: str, value: str, entry_id=None):
+    try:
+        if not value:
+            return
+        if value == "error":
+            await bot.send_message(user_id, "❌ Не удалось получить форматы видео.")
+            return
+
+        formats = json.loads(value)
+        if not formats:
+            await bot.send_message(user_id, "❌ Не удалось найти подходящие форматы.")
+            return
+
+        buttons = []
+        pipe = redis_client.pipeline()
+        for f in formats[:10]:
+            fid = f["format_id"]
+            filesize_mb = round(f["filesize"] / 1024 / 1024, 1)
+            label = f"{f.get('format_note') or ''} {f['ext']} - {filesize_mb}MB"
+            pipe.setex(f"yt:{user_id}:{fid}", 3600, url)
+            buttons.append([InlineKeyboardButton(text=label.strip(), callback_data=f"dl|{fid}")])
+        await pipe.execute()
+        keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+        await bot.send_message(user_id, "Выбери качество:", reply_markup=keyboard)
+        return True
+
+    except Exception as e:
+        logger.error(f"Ошибка при отправке форматов: {e}")
+        await bot.send_message(user_id, ERROR_MSG, parse_mode='HTML')
+        return False
+
+
+async def consume_results(bot: Bot):
+    """
+    Доставляет результаты Celery-задач из стрима сразу по мере появления
+    и обновляет статусные сообщения по прогрессу скачивания.
+    """
+    global progress_editor
+    progress_editor = ProgressEditor(bot)
+
+    async def on_download(user_id, url, value, entry_id, job=None):
+        return await deliver_s3_result(bot, user_id, url, value, entry_id, job)
+
+    async def on_formats(user_id, url, value, entry_id):
+        return await deliver_formats(bot, user_id, url, value, entry_id)
+
+    await asyncio.gather(
+        result_stream.consume({"download": on_download, "formats": on_formats}),
+        result_stream.consume({"progress": progress_editor.on_progress}, stream=result_stream.PROGRESS_STREAM_KEY),
+        progress_editor.run(),
+    )
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from redis_client.client_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PREFIX = "progress:"
+PROGRESS_TTL = 1800
+# Telegram: не больше ~1 сообщения в секунду в чат и ~30 в секунду всего, с запасом
+PER_CHAT_INTERVAL = 3.0
+MAX_EDITS_PER_TICK = 10
+TICK = 0.5
+
+STAGE_TEXT = {
+    "download": "📥 Скачиваю",
+    "upload": "☁️ Загружаю в облако",
+}
+
+
+async def register_status_message(job: str, user_id: int, message_id: int):
+    """
+    Запоминает статусное сообщение пользователя, которое будем редактировать по прогрессу задачи job.
+    """
+    key = f"{PROGRESS_PREFIX}{job}"
+    pipe = redis_client.pipeline()
+    pipe.hset(key, user_id, message_id)
+    pipe.expire(key, PROGRESS_TTL)
+    await pipe.execute()
+
+
+def format_progress(value: str) -> str | None:
+    stage, done, total = value.split("|")
+    done, total = int(done), int(total)
+    text = STAGE_TEXT.get(stage)
+    if not text:
+        return None
+    if total:
+        percent = min(done * 100 // total, 100)
+        return f"{text}... {percent}% ({done / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MB)"
+    return f"{text}... {done / 1024 / 1024:.1f} MB"
+
+
+class ProgressEditor:
+    """
+    Копит последние тексты прогресса по сообщениям и редактирует их с ограничением частоты.
+    Промежуточные состояния схлопываются: в чат уходит только самое свежее.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.pending: dict[tuple[int, int], str] = {}
+        # Сообщение -> (последний отправленный текст, когда)
+        self.last_text: dict[tuple[int, int], tuple[str, float]] = {}
+        self.last_edit: dict[int, float] = {}
+        # Сообщения доставленных задач -> когда доставлены: прогресс, прочитанный до finish, им не применяем
+        self.finished: dict[tuple[int, int], float] = {}
+        self.paused_until = 0.0
+        self.next_prune = 0.0
+
+    async def on_progress(self, user_id: int, job: str, value: str, entry_id=None):
+        text = format_progress(value)
+        if not text:
+            return
+        messages = await redis_client.hgetall(f"{PROGRESS_PREFIX}{job}")
+        for chat_id, message_id in messages.items():
+            key = (int(chat_id), int(message_id))
+            if key not in self.finished:
+                self.pending[key] = text
+
+    async def finish(self, job: str, chat_id: int):
+        """
+        Задача job доставлена в чат: отбрасываем её несделанные правки и снимаем сообщение
+        с учёта, чтобы запоздавший прогресс не правил его после ссылки. Другие задачи чата не трогаем.
+        """
+        key = f"{PROGRESS_PREFIX}{job}"
+        pipe = redis_client.pipeline()
+        pipe.hget(key, chat_id)
+        pipe.hdel(key, chat_id)
+        message_id, _ = await pipe.execute()
+        if message_id is None:
+            return
+        message = (chat_id, int(message_id))
+        self.finished[message] = time.monotonic()
+        self.pending.pop(message, None)
+        self.last_text.pop(message, None)
+
+    def _prune(self, now: float):
+        """
+        Чистит состояние, которое больше ни на что не влияет: паузы чатов старше PER_CHAT_INTERVAL,
+        тексты и отметки сообщений старше PROGRESS_TTL (задачи, которые так и не доставили).
+        """
+        for chat_id in [c for c, at in self.last_edit.items() if now - at >= PER_CHAT_INTERVAL]:
+            del self.last_edit[chat_id]
+        for key in [k for k, (_, at) in self.last_text.items() if now - at > PROGRESS_TTL]:
+            del self.last_text[key]
+        for key in [k for k, at in self.finished.items() if now - at > PROGRESS_TTL]:
+            del self.finished[key]
+
+    async def _flush(self):
+        now = time.monotonic()
+        if now >= self.next_prune:
+            self._prune(now)
+            self.next_prune = now + PER_CHAT_INTERVAL
+        if now < self.paused_until:
+            return
+        edits = 0
+        for (chat_id, message_id), text in list(self.pending.items()):
+            if edits >= MAX_EDITS_PER_TICK:
+                break
+            if now - self.last_edit.get(chat_id, 0) < PER_CHAT_INTERVAL:
+                continue
+            del self.pending[(chat_id, message_id)]
+            if self.last_text.get((chat_id, message_id), (None,))[0] == text:
+                continue
+            try:
+                await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+                self.last_text[(chat_id, message_id)] = (text, time.monotonic())
+            except TelegramRetryAfter as e:
+                self.paused_until = time.monotonic() + e.retry_after
+                self.pending.setdefault((chat_id, message_id), text)
+                return
+            except TelegramBadRequest as e:
+                # "message is not modified", сообщение удалено и т.п.
+                logger.debug(f"Не удалось обновить прогресс в {chat_id}: {e}")
+            self.last_edit[chat_id] = time.monotonic()
+            edits += 1
+
+    async def run(self):
+        while True:
+            try:
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Ошибка обновления прогресса: {e}")
+            await asyncio.sleep(TICK)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from db.ORM import SenderORM
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Глобальный ограничитель частоты: rate отправок в секунду, всплеск до capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def classify_failure(e: Exception) -> str | None:
+    """
+    Во что перевести получателя после ошибки отправки (None — статус не меняем).
+    Telegram отдаёт и блокировку бота, и удалённый аккаунт одним 403 (TelegramForbiddenError),
+    различаются они только описанием ошибки.
+    """
+    if isinstance(e, TelegramForbiddenError):
+        return "deleted" if "deactivated" in e.message else "blocked"
+    return None
+
+
+class StatusBuffer:
+    """
+    Копит смены статусов получателей и применяет их одним UPDATE на статус
+    каждые flush_size записей или flush_interval секунд. Фоновая задача (start)
+    сбрасывает остаток и тогда, когда новых ошибок долго нет.
+    """
+
+    def __init__(self, flush_size: int = 200, flush_interval: float = 5.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending: dict[str, list[int]] = {}
+        self.count = 0
+        self.flushed_at = time.monotonic()
+        self.task: asyncio.Task | None = None
+
+    async def add(self, user_id: int, status: str):
+        self.pending.setdefault(status, []).append(user_id)
+        self.count += 1
+        if self.count >= self.flush_size or time.monotonic() - self.flushed_at >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        self.count = 0
+        self.flushed_at = time.monotonic()
+        for status, user_ids in pending.items():
+            await SenderORM.bulk_update_status(user_ids, status)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.count and time.monotonic() - self.flushed_at >= self.flush_interval:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error(f"Ошибка записи статусов получателей: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновый сброс и применяет остаток.
+        """
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+
+@dataclass
+class BroadcastStats:
+    success: int = 0
+    errors: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    @property
+    def duration(self) -> float:
+        return time.time() - self.started_at
+
+
+class Broadcaster:
+    """
+    Рассылка пулом воркеров под общим ограничением частоты.
+    RetryAfter от Telegram останавливает всех воркеров на указанное время,
+    после чего получатель отправляется повторно.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        send: Callable[[Bot, int], Awaitable],
+        rate: float = 25,
+        workers: int = 20,
+        on_sent: Callable[[int], Awaitable] | None = None,
+        on_failed: Callable[[int, Exception], Awaitable] | None = None,
+    ):
+        self.bot = bot
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.resume_at = 0.0
+        self.stats = BroadcastStats()
+
+    async def _wait_pause(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, user_id: int):
+        while True:
+            await self._wait_pause()
+            await self.bucket.acquire()
+            try:
+                # send может вернуть False — получатель пропущен (например, рассылку отменили)
+                if await self.send(self.bot, user_id) is False:
+                    return
+            except TelegramRetryAfter as e:
+                # Flood control касается бота целиком — притормаживаем всех
+                self.resume_at = max(self.resume_at, time.monotonic() + e.retry_after)
+                logger.warning(f"RetryAfter {e.retry_after} сек., рассылка приостановлена")
+                continue
+            except Exception as e:
+                self.stats.errors += 1
+                logger.error(f"Ошибка при отправке пользователю {user_id}: {e}")
+                if self.on_failed:
+                    await self.on_failed(user_id, e)
+                return
+
+            self.stats.success += 1
+            logger.debug(f"Успешная отправка пользователю {user_id}")
+            if self.on_sent:
+                await self.on_sent(user_id)
+            return
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                if user_id is None:
+                    return
+                await self._deliver(user_id)
+            except Exception as e:
+                logger.exception(f"Ошибка воркера рассылки на {user_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def run(self, recipients: Iterable[int] | AsyncIterable[int]) -> BroadcastStats:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        try:
+            if hasattr(recipients, "__aiter__"):
+                async for user_id in recipients:
+                    await queue.put(user_id)
+            else:
+                for user_id in recipients:
+                    await queue.put(user_id)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        return self.stats
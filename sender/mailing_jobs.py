@@ -0,0 +1,125 @@
+import json
+import time
+import uuid
+
+from redis_client.client_redis import redis_client
+
+ACTIVE_KEY = "mailings:active"
+JOB_PREFIX = "mailing:"
+# Сколько храним завершённую рассылку для /mailing_status
+FINISHED_TTL = 7 * 24 * 3600
+
+RUNNING = "running"
+CANCELLED = "cancelled"
+DONE = "done"
+FAILED = "failed"
+
+
+class MailingJob:
+    """
+    Рассылка, сохранённая в Redis: содержимое, курсор по получателям и счётчики.
+
+    Получатели обходятся по возрастанию user_id пачками. cursor — последний user_id
+    полностью обработанной пачки; кому уже отправили внутри текущей пачки, лежит
+    в множестве :done. После рестарта рассылка продолжается с курсора, пропуская :done.
+    """
+
+    def __init__(self, job_id: str, fields: dict):
+        self.job_id = job_id
+        self.key = f"{JOB_PREFIX}{job_id}"
+        self.done_key = f"{self.key}:done"
+        self.mailing_data = json.loads(fields["payload"])
+        self.admin_chat_id = int(fields["admin_chat_id"])
+        self.cursor = int(fields.get("cursor") or 0)
+        self.status = fields.get("status", RUNNING)
+
+    @classmethod
+    async def create(cls, mailing_data: dict, admin_chat_id: int, total: int) -> "MailingJob":
+        job_id = uuid.uuid4().hex[:12]
+        fields = {
+            "payload": json.dumps(mailing_data, ensure_ascii=False),
+            "admin_chat_id": admin_chat_id,
+            "status": RUNNING,
+            "cursor": 0,
+            "total": total,
+            "sent": 0,
+            "errors": 0,
+            "created": int(time.time()),
+        }
+        pipe = redis_client.pipeline()
+        pipe.hset(f"{JOB_PREFIX}{job_id}", mapping=fields)
+        pipe.sadd(ACTIVE_KEY, job_id)
+        await pipe.execute()
+        return cls(job_id, {k: str(v) for k, v in fields.items()})
+
+    @classmethod
+    async def load(cls, job_id: str) -> "MailingJob | None":
+        raw = await redis_client.hgetall(f"{JOB_PREFIX}{job_id}")
+        if not raw:
+            return None
+        return cls(job_id, {k.decode(): v.decode() for k, v in raw.items()})
+
+    async def already_done(self) -> set[int]:
+        """
+        Кому уже отправлено в незавершённой пачке (нужно только при возобновлении).
+        """
+        return {int(user_id) for user_id in await redis_client.smembers(self.done_key)}
+
+    async def checkpoint(self, sent: list[int], failed: list[int]) -> str:
+        """
+        Одним пайплайном сохраняет обработанных получателей и счётчики,
+        заодно читает статус, чтобы заметить отмену. Возвращает статус.
+        """
+        pipe = redis_client.pipeline()
+        if sent or failed:
+            pipe.sadd(self.done_key, *sent, *failed)
+        pipe.hincrby(self.key, "sent", len(sent))
+        pipe.hincrby(self.key, "errors", len(failed))
+        pipe.hget(self.key, "status")
+        status = (await pipe.execute())[-1]
+        self.status = status.decode() if status else CANCELLED
+        return self.status
+
+    async def advance(self, cursor: int):
+        """
+        Пачка обработана целиком: двигаем курсор и очищаем :done.
+        """
+        self.cursor = cursor
+        pipe = redis_client.pipeline()
+        pipe.hset(self.key, "cursor", cursor)
+        pipe.delete(self.done_key)
+        await pipe.execute()
+
+    async def finish(self, status: str):
+        self.status = status
+        pipe = redis_client.pipeline()
+        pipe.hset(self.key, "status", status)
+        pipe.expire(self.key, FINISHED_TTL)
+        pipe.delete(self.done_key)
+        pipe.srem(ACTIVE_KEY, self.job_id)
+        await pipe.execute()
+
+
+async def active_job_ids() -> list[str]:
+    return sorted(job_id.decode() for job_id in await redis_client.smembers(ACTIVE_KEY))
+
+
+async def get_progress(job_id: str) -> dict | None:
+    """
+    O(1) чтение счётчиков рассылки.
+    """
+    total, sent, errors, status = await redis_client.hmget(
+        f"{JOB_PREFIX}{job_id}", "total", "sent", "errors", "status"
+    )
+    if status is None:
+        return None
+    return {
+        "total": int(total or 0),
+        "sent": int(sent or 0),
+        "errors": int(errors or 0),
+        "status": status.decode(),
+    }
+
+
+async def cancel(job_id: str):
+    await redis_client.hset(f"{JOB_PREFIX}{job_id}", "status", CANCELLED)
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from aiogram import Bot
+from aiogram.utils.media_group import MediaGroupBuilder
+
+# Порядок проверки одиночного сообщения в старом формате (message_data)
+SINGLE_MEDIA = ("photo", "video", "document", "audio", "voice")
+
+
+@dataclass(frozen=True)
+class SendPlan:
+    """
+    Рассылка, собранная один раз: метод Bot и готовые аргументы.
+    На получателя остаётся только подставить chat_id.
+    """
+    method: str
+    kwargs: Mapping[str, Any]
+
+    async def send(self, bot: Bot, chat_id: int):
+        return await getattr(bot, self.method)(chat_id, **self.kwargs)
+
+
+def _plan(method: str, **kwargs) -> SendPlan:
+    return SendPlan(method, MappingProxyType(kwargs))
+
+
+def compile_send_plan(mailing_data: dict) -> SendPlan:
+    """
+    Если известно исходное сообщение администратора, рассылка копирует его
+    (copy_message / copy_messages для альбома) — Telegram сам размножает медиа.
+    Рассылки, созданные до появления source, собираются из сохранённых file_id.
+    """
+    source = mailing_data.get("source")
+    if source:
+        message_ids = source["message_ids"]
+        if len(message_ids) > 1:
+            return _plan("copy_messages", from_chat_id=source["chat_id"], message_ids=list(message_ids))
+        return _plan("copy_message", from_chat_id=source["chat_id"], message_id=message_ids[0])
+
+    if "media_messages" in mailing_data:
+        media_group = MediaGroupBuilder(caption=mailing_data["media_messages"][0].get("caption"))
+        for media in mailing_data["media_messages"]:
+            media_group.add(type=media["type"], media=media["file_id"])
+        return _plan("send_media_group", media=media_group.build())
+
+    message_data = mailing_data.get("message_data", mailing_data)
+    for kind in SINGLE_MEDIA:
+        if message_data.get(kind):
+            return _plan(f"send_{kind}", **{kind: message_data[kind]}, caption=message_data.get("caption"))
+    if message_data.get("text"):
+        return _plan("send_message", text=message_data["text"])
+    raise ValueError("В рассылке нет содержимого для отправки")
@@ -1,57 +1,53 @@
 import asyncio
 import json
 import logging
-import time
 
 from aiogram import F, Bot, Router, types
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.media_group import MediaGroupBuilder
-from config_data.config import ConfigEnv, load_config
+from config_data.config import get_config
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
 from db.ORM import SenderORM
+from sender import mailing_jobs
+from sender.broadcast import Broadcaster, StatusBuffer, classify_failure
+from sender.send_plan import compile_send_plan
 from middlewares.album_middleware import AlbumMiddleware
-from aiogram.fsm.storage.redis import Redis
 
 logger = logging.getLogger(__name__)
-config: ConfigEnv = load_config()
-
-redis = Redis(host=config.redis.host, port=config.redis.port, password=config.redis.password)
-# Список администраторов
-ADMIN_IDS = config.tg_bot.admin_ids
 
 router = Router()
-router.message.middleware(AlbumMiddleware(0.5, ADMIN_IDS))
+router.message.middleware(AlbumMiddleware(0.5))
+
+# Ссылки на фоновые рассылки, чтобы задачи не собрал GC
+mailing_tasks: set[asyncio.Task] = set()
+# Получатели обрабатываются пачками; курсор сохраняется после каждой пачки
+MAILING_BATCH = 500
+# Прогресс внутри пачки сохраняется пайплайном каждые CHECKPOINT_EVERY отправок
+CHECKPOINT_EVERY = 50
 
 
 class FSMFillForm(StatesGroup):
     SEND_type = State()
     SEND_ids = State()
     SEND_text = State()
-    SEND_process = State()
-
-
-@router.message(Command(commands="start_mailing"), StateFilter(FSMFillForm.SEND_process))
-async def start_mailing_process(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
-        logger.warning(
-            f"Попытка несанкционированного доступа от пользователя {message.from_user.id}:{message.from_user.username}")
-        await message.reply("У вас нет прав для выполнения этой команды.")
-        return
-    await message.answer("Рассылка уже запущена")
 
 
 # Главная команда для начала рассылки
 @router.message(Command(commands="start_mailing"))
 async def start_mailing(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
         logger.warning(
             f"Попытка несанкционированного доступа от пользователя {message.from_user.id}:{message.from_user.username}")
         await message.reply("У вас нет прав для выполнения этой команды.")
         return
 
+    if await mailing_jobs.active_job_ids():
+        await message.answer("Рассылка уже запущена")
+        return
+
     logger.info(f"Начата новая рассылка администратором {message.from_user.id}:{message.from_user.username}")
 
     instruction = (
@@ -81,42 +77,49 @@ async def start_mailing(message: types.Message):
 
 @router.message(Command(commands="mailing_status"))
 async def mailing_status(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
         await message.reply("❌ У вас нет прав для этой команды.")
         return
 
-    redis_key = "mailing_progress"
     try:
-        remaining = await redis.scard(redis_key)
-        total = int(await redis.get("mailing_total") or 0)
-        sent = total - remaining
-        percent = (sent / total) * 100 if total else 0
-
-        await message.reply(
-            f"📊 Статус рассылки:\n"
-            f"Отправлено: {sent}/{total}\n"
-            f"Осталось: {remaining}\n"
-            f"Выполнено: {percent:.1f}%"
-        )
+        job_ids = await mailing_jobs.active_job_ids()
+        if not job_ids:
+            await message.reply("📊 Активных рассылок нет.")
+            return
+
+        lines = ["📊 Статус рассылки:"]
+        for job_id in job_ids:
+            progress = await mailing_jobs.get_progress(job_id)
+            if not progress:
+                continue
+            processed = progress["sent"] + progress["errors"]
+            total = progress["total"]
+            percent = (processed / total) * 100 if total else 0
+            lines.append(
+                f"\n#{job_id} ({progress['status']})\n"
+                f"Отправлено: {progress['sent']}/{total}\n"
+                f"Ошибок: {progress['errors']}\n"
+                f"Осталось: {max(total - processed, 0)}\n"
+                f"Выполнено: {percent:.1f}%"
+            )
+        await message.reply("\n".join(lines))
     except Exception as e:
         logger.error(f"Ошибка получения статуса рассылки: {e}", exc_info=True)
         await message.reply("⚠️ Не удалось получить статус рассылки.")
 
 @router.message(Command(commands="cancel_mailing"))
 async def cancel_mailing(message: types.Message, state: FSMContext):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in get_config().tg_bot.admin_ids:
         await message.reply("❌ У вас нет прав для этой команды.")
         return
 
-    redis_key = "mailing_progress"
-
     try:
-        # Удаляем прогресс рассылки и, если есть, общее количество
-        await redis.delete(redis_key)
-        await redis.delete("mailing_total")
+        # Рассылка увидит отмену на ближайшем чекпоинте и завершится сама
+        for job_id in await mailing_jobs.active_job_ids():
+            await mailing_jobs.cancel(job_id)
         await state.clear()
         logger.info(f"Рассылка отменена администратором {message.from_user.id}:{message.from_user.username}")
-        await message.reply("❌ Рассылка отменена. Прогресс удалён.")
+        await message.reply("❌ Рассылка отменена.")
     except Exception as e:
         logger.error(f"Ошибка при отмене рассылки: {e}", exc_info=True)
         await message.reply("⚠️ Ошибка при попытке отменить рассылку.")
@@ -185,8 +188,11 @@ async def accept_photos(message: types.Message, bot: Bot, state: FSMContext, alb
 
             media_messages.append(media_info)
 
-        # Сохраняем информацию о медиагруппе в состояние
-        await state.update_data(media_messages=media_messages)
+        # Сохраняем информацию о медиагруппе в состояние; рассылка скопирует исходные сообщения
+        await state.update_data(
+            media_messages=media_messages,
+            source={"chat_id": message.chat.id, "message_ids": [msg.message_id for msg in album]},
+        )
 
         # Создаем медиагруппу для предпросмотра
         preview_group = MediaGroupBuilder(caption=media_messages[0].get('caption', None))
@@ -239,7 +245,10 @@ async def process_message(message: types.Message, state: FSMContext):
             'caption': message.caption,
         }
 
-        await state.update_data(message_data=message_data)
+        await state.update_data(
+            message_data=message_data,
+            source={"chat_id": message.chat.id, "message_ids": [message.message_id]},
+        )
 
         # Формируем текст подтверждения
         confirm_text = "Вы уверены, что хотите отправить это сообщение?\n\n"
@@ -311,89 +320,158 @@ async def confirm_mailing(callback: types.CallbackQuery, state: FSMContext, bot:
         await state.clear()
         return
 
-    await state.set_state(FSMFillForm.SEND_process)
     logger.info(f"Начата рассылка от пользователя {callback.from_user.id}:{callback.from_user.username}")
     mailing_data = await state.get_data()
+    await state.clear()
 
-    # Логируем тип рассылки и количество получателей
-    recipient_ids = []
-    if mailing_data["type"] == "send_all":
-        recipient_ids = get_all_user_ids()
-        logger.info(f"Тип рассылки: всем пользователям. Количество получателей: {len(recipient_ids)}")
-    elif mailing_data["type"] == "send_selected":
-        recipient_ids = mailing_data["ids"]
-        logger.info(f"Тип рассылки: выбранным пользователям. Количество получателей: {len(recipient_ids)}")
-    elif mailing_data["type"] == "exclude_ids":
-        all_ids = get_all_user_ids()
-        recipient_ids = [user_id for user_id in all_ids if user_id not in mailing_data["ids"]]
-        logger.info(f"Тип рассылки: всем кроме исключенных. Количество получателей: {len(recipient_ids)}")
+    total = await count_recipients(mailing_data)
+    logger.info(f"Тип рассылки: {mailing_data['type']}. Количество получателей: {total}")
 
+    # Содержимое и прогресс рассылки хранятся в Redis — после рестарта она продолжится
+    job = await mailing_jobs.MailingJob.create(mailing_data, callback.message.chat.id, total)
     await callback.message.answer(
-        f"Начата рассылка от пользователя {callback.from_user.id}:{callback.from_user.username}\nТип рассылки: всем пользователям. Количество получателей: {len(recipient_ids)}")
-
-
-    # Сохраняем список получателей в Redis
-    redis_key = "mailing_progress"
-    await redis.sadd(redis_key, *recipient_ids)
-    await redis.set("mailing_total", len(recipient_ids))
-
-    success_count = 0
-    error_count = 0
-    start_time = time.time()
-
-    for user_id in recipient_ids:
-        if await redis.sismember(redis_key, user_id):
-            try:
-                if 'media_messages' in mailing_data:
-                    # Используем MediaGroupBuilder для медиагрупп
-                    media_group = MediaGroupBuilder(caption=mailing_data['media_messages'][0].get('caption'))
-                    for media in mailing_data['media_messages']:
-                        media_group.add(
-                            type=media['type'],
-                            media=media['file_id']
-                        )
-                    await bot.send_media_group(user_id, media=media_group.build())
-                elif mailing_data.get('photo'):
-                    await bot.send_photo(user_id, mailing_data['photo'], caption=mailing_data.get('caption'))
-                elif mailing_data.get('video'):
-                    await bot.send_video(user_id, mailing_data['video'], caption=mailing_data.get('caption'))
-                elif mailing_data.get('document'):
-                    await bot.send_document(user_id, mailing_data['document'], caption=mailing_data.get('caption'))
-                elif mailing_data.get('audio'):
-                    await bot.send_audio(user_id, mailing_data['audio'], caption=mailing_data.get('caption'))
-                elif mailing_data.get('voice'):
-                    await bot.send_voice(user_id, mailing_data['voice'], caption=mailing_data.get('caption'))
-                elif mailing_data.get('text'):
-                    await bot.send_message(user_id, mailing_data['text'])
-                success_count += 1
-                logger.debug(f"Успешная отправка пользователю {user_id}")
-                await redis.srem(redis_key, user_id)
-                await asyncio.sleep(0.5)
-            except Exception as e:
-                error_count += 1
-                await redis.srem(redis_key, user_id)
-                logger.error(f"Ошибка при отправке пользователю {user_id}: {e}")
-                # Пробуем понять тип ошибки и обновить статус
-                error_str = str(e)
-                if "bot was blocked by the user" in error_str:
-                    await SenderORM.update_user_status(user_id, "blocked")
-                elif "user is deactivated" in error_str:
-                    await SenderORM.update_user_status(user_id, "deleted")
-
-    end_time = time.time()
-    duration = end_time - start_time
-    logger.info(f"Рассылка завершена. Успешно: {success_count}, Ошибок: {error_count}, Время: {duration:.2f} сек.")
-    await callback.message.answer(
-        f"Рассылка завершена.\n"
-        f"Успешно отправлено: {success_count}\n"
-        f"Ошибок: {error_count}\n"
-        f"Время выполнения: {duration:.2f} сек."
-    )
-    await state.clear()
+        f"Начата рассылка #{job.job_id} от пользователя {callback.from_user.id}:{callback.from_user.username}\n"
+        f"Тип рассылки: {mailing_data['type']}. Количество получателей: {total}")
+
+    start_mailing_task(bot, job)
+
+
+async def count_recipients(mailing_data: dict) -> int:
+    if mailing_data["type"] == "send_selected":
+        return len(set(mailing_data["ids"]))
+    exclude = mailing_data["ids"] if mailing_data["type"] == "exclude_ids" else None
+    return await SenderORM.count_active_users(exclude)
 
 
-# Функция для получения всех ID пользователей (пример)
-async def get_all_user_ids():
-    # Замените на реальную логику получения пользователей
+async def iter_recipients(mailing_data: dict, after_id: int = 0):
+    """
+    Получатели рассылки по возрастанию user_id начиная после after_id (в этом порядке двигается курсор).
+    Для рассылки всем пользователи читаются из БД постранично, не целиком.
+    """
+    if mailing_data["type"] == "send_selected":
+        for user_id in sorted(set(mailing_data["ids"])):
+            if user_id > after_id:
+                yield user_id
+        return
 
-    return await SenderORM.get_all_user_ids_active()
+    exclude = mailing_data["ids"] if mailing_data["type"] == "exclude_ids" else None
+    async for user_id in SenderORM.iter_active_user_ids(after_id, exclude, page_size=MAILING_BATCH):
+        yield user_id
+
+
+async def batched(recipients, size: int):
+    batch = []
+    async for user_id in recipients:
+        batch.append(user_id)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def start_mailing_task(bot: Bot, job: mailing_jobs.MailingJob):
+    # Рассылка идёт в фоне, обработчик сразу освобождается
+    task = asyncio.create_task(run_mailing(bot, job))
+    mailing_tasks.add(task)
+    task.add_done_callback(mailing_tasks.discard)
+
+
+async def resume_mailings(bot: Bot):
+    """
+    Продолжает рассылки, прерванные остановкой бота.
+    Ошибка одной рассылки (битая запись, недоступный чат админа) не мешает остальным и запуску бота.
+    """
+    for job_id in await mailing_jobs.active_job_ids():
+        try:
+            job = await mailing_jobs.MailingJob.load(job_id)
+            if not job:
+                continue
+            if job.status != mailing_jobs.RUNNING:
+                await job.finish(job.status)
+                continue
+            logger.info(f"Возобновляем рассылку #{job_id} с user_id > {job.cursor}")
+            start_mailing_task(bot, job)
+        except Exception as e:
+            logger.exception(f"Не удалось возобновить рассылку #{job_id}: {e}")
+            continue
+
+        try:
+            await bot.send_message(job.admin_chat_id, f"🔄 Рассылка #{job_id} возобновлена после перезапуска.")
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить админа о рассылке #{job_id}: {e}")
+
+
+async def run_mailing(bot: Bot, job: mailing_jobs.MailingJob):
+    mailing_data = job.mailing_data
+    pending_sent, pending_failed = [], []
+    status_buffer = StatusBuffer()
+
+    async def checkpoint():
+        nonlocal pending_sent, pending_failed
+        sent, failed = pending_sent, pending_failed
+        pending_sent, pending_failed = [], []
+        await job.checkpoint(sent, failed)
+
+    async def send(bot: Bot, user_id: int):
+        # Рассылку могли отменить через /cancel_mailing
+        if job.status != mailing_jobs.RUNNING:
+            return False
+        await plan.send(bot, user_id)
+
+    async def on_sent(user_id: int):
+        pending_sent.append(user_id)
+        if len(pending_sent) + len(pending_failed) >= CHECKPOINT_EVERY:
+            await checkpoint()
+
+    async def on_failed(user_id: int, e: Exception):
+        pending_failed.append(user_id)
+        # Заблокировавших бота и удалённых помечаем пачками, не прерывая рассылку на запрос в БД
+        new_status = classify_failure(e)
+        if new_status:
+            await status_buffer.add(user_id, new_status)
+        if len(pending_sent) + len(pending_failed) >= CHECKPOINT_EVERY:
+            await checkpoint()
+
+    broadcaster = Broadcaster(
+        bot, send,
+        rate=get_config().mailing.rate,
+        workers=get_config().mailing.workers,
+        on_sent=on_sent,
+        on_failed=on_failed,
+    )
+    status_buffer.start()
+    try:
+        # Содержимое собирается один раз на рассылку, а не на каждого получателя
+        plan = compile_send_plan(mailing_data)
+        # Кому уже отправили в пачке, на которой остановились в прошлый раз
+        skip = await job.already_done()
+        async for batch in batched(iter_recipients(mailing_data, job.cursor), MAILING_BATCH):
+            await broadcaster.run([user_id for user_id in batch if user_id not in skip])
+            await checkpoint()
+            if job.status != mailing_jobs.RUNNING:
+                break
+            await job.advance(batch[-1])
+            skip = set()
+
+        # Остаток накопленных статусов применяем до отчёта
+        await status_buffer.stop()
+        await job.finish(mailing_jobs.DONE if job.status == mailing_jobs.RUNNING else job.status)
+    except Exception as e:
+        logger.error(f"Рассылка #{job.job_id} прервана: {e}", exc_info=True)
+        await checkpoint()
+        await status_buffer.stop()
+        await job.finish(mailing_jobs.FAILED)
+        await bot.send_message(job.admin_chat_id, f"⚠️ Рассылка #{job.job_id} прервана из-за ошибки: {e}")
+        return
+
+    progress = await mailing_jobs.get_progress(job.job_id)
+    logger.info(f"Рассылка #{job.job_id} завершена ({job.status}). Успешно: {progress['sent']}, "
+                f"Ошибок: {progress['errors']}, Время: {broadcaster.stats.duration:.2f} сек.")
+    await bot.send_message(
+        job.admin_chat_id,
+        f"Рассылка #{job.job_id} {'завершена' if job.status == mailing_jobs.DONE else 'остановлена'}.\n"
+        f"Успешно отправлено: {progress['sent']}\n"
+        f"Ошибок: {progress['errors']}\n"
+        f"Время выполнения: {broadcaster.stats.duration:.2f} сек."
+    )
@@ -22,6 +22,15 @@ if not User.objects.filter(username=username).exists():
 # Get the service type from the first argument
 SERVICE_TYPE=$1
 
+# Prefork-процессы Celery пишут метрики Prometheus в общий каталог, эндпоинт воркера их суммирует
+case $SERVICE_TYPE in
+    celery*)
+        export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_$SERVICE_TYPE}"
+        rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+        mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+        ;;
+esac
+
 case $SERVICE_TYPE in
     "admin_panel")
         echo "Starting API service..."
@@ -33,10 +42,24 @@ case $SERVICE_TYPE in
         ;;
     "celery")
         echo "Starting Celery worker..."
-        uv run celery -A celery_app.tasks:app worker  -l info
+        uv run celery -A celery_app.tasks:app worker -Q probe,download -l info
+        ;;
+    "celery_probe")
+        # Разбор форматов: короткие задачи, много параллельных, можно брать с запасом
+        echo "Starting Celery probe worker..."
+        uv run celery -A celery_app.tasks:app worker -Q probe -n probe@%h -l info \
+            --concurrency "${CELERY_PROBE_CONCURRENCY:-8}" \
+            --prefetch-multiplier "${CELERY_PROBE_PREFETCH:-4}"
+        ;;
+    "celery_download")
+        # Скачивания: долгие задачи, по одной на процесс, без предвыборки
+        echo "Starting Celery download worker..."
+        uv run celery -A celery_app.tasks:app worker -Q download -n download@%h -l info \
+            --concurrency "${CELERY_DOWNLOAD_CONCURRENCY:-4}" \
+            --prefetch-multiplier "${CELERY_DOWNLOAD_PREFETCH:-1}"
         ;;
     *)
-        echo "Invalid service type. Please use 'bot', 'admin_panel' or 'celery'"
+        echo "Invalid service type. Please use 'bot', 'admin_panel', 'celery', 'celery_probe' or 'celery_download'"
         exit 1
         ;;
 esac
@@ -1,23 +1,13 @@
-from db.ORM import DataBase
-from redis_client.client_redis import redis_client
+from db import user_cache
 
+DEFAULT_DOWNLOAD_LIMIT = 3
 
-async def can_download(user_id: int,) -> bool:
-    # Получаем лимит из БД
-    user = await DataBase.get_user(user_id)
-    if not user:
-        return False  # или True, если гость — разрешить?
-    limit = user.download_limit or 3
 
-    # Получаем счетчик из Redis
-    key = f"downloads:{user_id}"
-    value = await redis_client.get(key)
-    current = int(value) if value else 0
-    return current < limit
-
-async def incr_download(user_id: int, url: str):
-    key = f"downloads:{user_id}"
-    pipe = redis_client.pipeline()
-    pipe.incr(key)
-    pipe.expire(key, 60 * 60 * 12)
-    await pipe.execute()
+async def get_download_limit(user_id: int) -> int | None:
+    """
+    Лимит скачиваний пользователя (через кэш профилей) или None, если пользователь не найден.
+    """
+    profile = await user_cache.get_profile(user_id)
+    if not profile:
+        return None
+    return profile["download_limit"] or DEFAULT_DOWNLOAD_LIMIT
@@ -1,7 +1,36 @@
 import re
+from urllib.parse import urlparse, parse_qs
+
+
+YOUTUBE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{11}$")
 
 
 def sanitize_filename(title: str) -> str:
     # Удаляем запрещённые символы для файлов: / \ : * ? " < > |
     return re.sub(r'[\\/:"*?<>|]+', "", title)
 
+
+def extract_video_id(url: str) -> str:
+    """
+    Возвращает канонический ID видео YouTube для любой формы ссылки
+    (youtu.be/ID, watch?v=ID, shorts/ID, embed/ID, live/ID).
+    Если ID выделить не удалось — возвращает саму ссылку без пробелов.
+    """
+    url = url.strip()
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    host = (parsed.hostname or "").lower()
+    path_parts = [p for p in parsed.path.split("/") if p]
+
+    candidate = None
+    if host.endswith("youtu.be") and path_parts:
+        candidate = path_parts[0]
+    elif "youtube" in host:
+        query_id = parse_qs(parsed.query).get("v")
+        if query_id:
+            candidate = query_id[0]
+        elif len(path_parts) >= 2 and path_parts[0] in ("shorts", "embed", "live", "v"):
+            candidate = path_parts[1]
+
+    if candidate and YOUTUBE_ID_RE.match(candidate):
+        return candidate
+    return url
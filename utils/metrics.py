@@ -0,0 +1,193 @@
+"""
+Метрики Prometheus для бота и Celery-воркеров.
+
+Бот и каждый воркер поднимают свой эндпоинт /metrics (start_metrics_server).
+У prefork-воркера задачи выполняются в дочерних процессах, поэтому для него
+задаётся PROMETHEUS_MULTIPROC_DIR (см. start.sh): дочерние процессы пишут метрики
+в файлы, а эндпоинт главного процесса собирает их вместе.
+"""
+import logging
+import os
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Длительности от миллисекунд (Redis) до десятков минут (скачивание)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+THROUGHPUT_BUCKETS = tuple(mb * 1024 * 1024 for mb in (0.5, 1, 2, 5, 10, 20, 50, 100, 200))
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время работы обработчика aiogram",
+    ["router", "event", "status"], buckets=FAST_BUCKETS + (5, 10, 30),
+)
+TASK_DURATION = Histogram(
+    "celery_task_seconds", "Длительность Celery-задачи",
+    ["task", "state"], buckets=SLOW_BUCKETS,
+)
+DOWNLOADED_BYTES = Counter("media_downloaded_bytes_total", "Байт скачано с источника", ["mode"])
+S3_UPLOADED_BYTES = Counter("s3_uploaded_bytes_total", "Байт загружено в S3", ["mode"])
+S3_UPLOAD_FAILURES = Counter("s3_upload_failures_total", "Неудачных загрузок объекта в S3", ["mode"])
+S3_UPLOAD_SECONDS = Histogram("s3_upload_seconds", "Длительность загрузки объекта в S3", ["mode"],
+                              buckets=SLOW_BUCKETS)
+S3_UPLOAD_THROUGHPUT = Histogram("s3_upload_throughput_bytes_per_second", "Скорость загрузки объекта в S3",
+                                 ["mode"], buckets=THROUGHPUT_BUCKETS)
+REDIS_LATENCY = Histogram("redis_command_seconds", "Время команды Redis", ["command"], buckets=FAST_BUCKETS)
+POSTGRES_LATENCY = Histogram("postgres_statement_seconds", "Время выполнения запроса Postgres", ["statement"],
+                             buckets=FAST_BUCKETS)
+SCHEDULER_JOB_LAG = Histogram("scheduler_job_lag_seconds", "Запоздание запуска задачи планировщика",
+                              ["job"], buckets=LAG_BUCKETS)
+POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_seconds", "Ожидание соединения из пула SQLAlchemy", ["pool"],
+                               buckets=FAST_BUCKETS + (5, 10, 30))
+POOL_CHECKOUT_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Не дождались соединения за pool_timeout",
+                                 ["pool"])
+STREAM_DELIVERY_LAG = Histogram("stream_delivery_lag_seconds", "От записи в стрим до обработки ботом",
+                                ["stream", "kind"], buckets=LAG_BUCKETS)
+
+
+def start_metrics_server(port: int):
+    """
+    Поднимает /metrics на port. В многопроцессном режиме отдаёт сумму по всем процессам.
+    """
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+    logger.info(f"Метрики Prometheus доступны на :{port}/metrics")
+    return registry
+
+
+def mark_process_dead(pid: int):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+class QueueDepthCollector:
+    """
+    Глубина очередей Celery (списки брокера в Redis) и число неподтверждённых
+    записей в стримах результатов — считаются в момент запроса /metrics.
+    """
+
+    def __init__(self, queues, streams=(), group: str | None = None):
+        self.queues = tuple(queues)
+        self.streams = tuple(streams)
+        self.group = group
+
+    def collect(self):
+        from redis_client.client_redis import sync_redis
+
+        queue_depth = GaugeMetricFamily("celery_queue_depth", "Задач в очереди Celery", labels=["queue"])
+        stream_pending = GaugeMetricFamily("stream_pending_entries", "Неподтверждённых записей в стриме",
+                                           labels=["stream"])
+        try:
+            pipe = sync_redis.pipeline(transaction=False)
+            for name in self.queues:
+                pipe.llen(name)
+            for name in self.streams:
+                pipe.xpending(name, self.group)
+            results = pipe.execute(raise_on_error=False)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать глубину очередей: {e}")
+            return
+
+        for name, depth in zip(self.queues, results):
+            if isinstance(depth, int):
+                queue_depth.add_metric([name], depth)
+        for name, pending in zip(self.streams, results[len(self.queues):]):
+            if isinstance(pending, dict):
+                stream_pending.add_metric([name], pending.get("pending", 0))
+        yield queue_depth
+        yield stream_pending
+
+
+class PoolCollector:
+    """
+    Загрузка пулов соединений SQLAlchemy в момент запроса /metrics.
+    pools — функция, возвращающая {имя: пул} (синхронный движок создаётся лениво),
+    max_overflow — тот же предел, что передан движкам (POSTGRES_MAX_OVERFLOW).
+    """
+
+    def __init__(self, pools, max_overflow: int):
+        self.pools = pools
+        # -1 у SQLAlchemy — без предела; тогда ёмкость считаем по pool_size
+        self.max_overflow = max(max_overflow, 0)
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Выданных соединений", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Открытых соединений сверх pool_size", labels=["pool"])
+        capacity = GaugeMetricFamily("db_pool_capacity", "pool_size + max_overflow", labels=["pool"])
+        saturation = GaugeMetricFamily("db_pool_saturation", "Доля занятых соединений от предела", labels=["pool"])
+        for name, pool in self.pools().items():
+            if not hasattr(pool, "checkedout"):
+                # NullPool: соединения не копятся, считать нечего
+                continue
+            limit = pool.size() + self.max_overflow
+            busy = pool.checkedout()
+            checked_out.add_metric([name], busy)
+            # overflow() отрицателен, пока не открыты все pool_size соединений
+            overflow.add_metric([name], max(pool.overflow(), 0))
+            capacity.add_metric([name], limit)
+            saturation.add_metric([name], busy / limit if limit else 0)
+        yield checked_out
+        yield overflow
+        yield capacity
+        yield saturation
+
+
+def instrument_engine(engine):
+    """
+    Время каждого запроса через события SQLAlchemy (для async-движка передаётся engine.sync_engine).
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+        POSTGRES_LATENCY.labels(verb).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # Чтобы стек времён не рос на упавших запросах
+        stack = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+def observe_s3_upload(mode: str, size: int, seconds: float):
+    S3_UPLOADED_BYTES.labels(mode).inc(size)
+    S3_UPLOAD_SECONDS.labels(mode).observe(seconds)
+    if seconds > 0:
+        S3_UPLOAD_THROUGHPUT.labels(mode).observe(size / seconds)
+
+
+def observe_s3_failure(mode: str):
+    S3_UPLOAD_FAILURES.labels(mode).inc()
+
+
+def observe_stream_delivery(stream: str, kind: str, entry_id):
+    # ID записи стрима начинается с времени XADD в миллисекундах
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    written_ms = int(str(entry_id).split("-", 1)[0])
+    STREAM_DELIVERY_LAG.labels(stream, kind).observe(max(time.time() - written_ms / 1000, 0))
+
+
+def scheduler_listener(event):
+    """
+    Слушатель APScheduler на EVENT_JOB_SUBMITTED: насколько запуск отстал от расписания.
+    """
+    from datetime import datetime
+
+    for scheduled in event.scheduled_run_times:
+        lag = (datetime.now(scheduled.tzinfo) - scheduled).total_seconds()
+        SCHEDULER_JOB_LAG.labels(event.job_id).observe(max(lag, 0))
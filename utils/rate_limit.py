@@ -0,0 +1,121 @@
+import uuid
+from dataclasses import dataclass
+
+from redis_client.client_redis import redis_client, sync_redis
+
+SLIDING_WINDOW = "sw"
+TOKEN_BUCKET = "tb"
+
+DOWNLOAD_WINDOW = 12 * 3600
+# Блокировки действий — token bucket в хэше. Префикс отличается от прежних строковых
+# ключей throttle:{user_id}:{action}, чтобы они не ломали скрипт (WRONGTYPE) до истечения
+THROTTLE_PREFIX = "throttle:tb:"
+
+# Проверяет все правила и списывает попытку только если прошли все — за один вызов.
+# KEYS: ключи правил; ARGV[1]: уникальный id попытки; дальше по три значения на правило:
+# тип (sw/tb), лимит, окно в мс. Возвращает 0 или номер первого сработавшего правила.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local member = ARGV[1]
+local buckets = {}
+
+for i, key in ipairs(KEYS) do
+    local kind = ARGV[i * 3 - 1]
+    local limit = tonumber(ARGV[i * 3])
+    local window = tonumber(ARGV[i * 3 + 1])
+
+    if kind == 'sw' then
+        redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+        if redis.call('ZCARD', key) >= limit then
+            return i
+        end
+    else
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or limit
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(limit, tokens + (now - ts) * limit / window)
+        if tokens < 1 then
+            return i
+        end
+        buckets[i] = tokens
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[i * 3 + 1])
+    if ARGV[i * 3 - 1] == 'sw' then
+        redis.call('ZADD', key, now, member)
+    else
+        redis.call('HSET', key, 'tokens', buckets[i] - 1, 'ts', now)
+    end
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+_acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Правило ограничения: не больше limit попыток за window секунд.
+    sw — скользящее окно (точный счёт, можно снять попытку),
+    tb — token bucket (допускает всплеск до limit, потом равномерно).
+    """
+    key: str
+    limit: int
+    window: float
+    kind: str = SLIDING_WINDOW
+
+
+async def acquire(*rules: Rule) -> Rule | None:
+    """
+    Атомарно проверяет все правила и, если ни одно не сработало, списывает попытку по каждому.
+    Возвращает первое сработавшее правило или None.
+    """
+    args = [uuid.uuid4().hex]
+    for rule in rules:
+        args += [rule.kind, rule.limit, int(rule.window * 1000)]
+    rejected = await _acquire(keys=[rule.key for rule in rules], args=args)
+    return rules[rejected - 1] if rejected else None
+
+
+def throttle_rule(user_id: int, action: str, seconds: float = 3) -> Rule:
+    """
+    Одно действие action в seconds секунд (или пока его не отпустят через release_throttle).
+    """
+    return Rule(f"{THROTTLE_PREFIX}{user_id}:{action}", 1, seconds, TOKEN_BUCKET)
+
+
+def download_quota_rule(user_id: int, limit: int) -> Rule:
+    return Rule(f"quota:downloads:{user_id}", limit, DOWNLOAD_WINDOW)
+
+
+async def check_throttle(user_id: int, action: str, seconds: float = 3) -> bool:
+    """
+    True, если действие сейчас запрещено.
+    """
+    return await acquire(throttle_rule(user_id, action, seconds)) is not None
+
+
+def release_throttle(user_id: int, action: str):
+    """
+    Снимает блокировку действия досрочно (вызывается из Celery-задач).
+    """
+    sync_redis.delete(f"{THROTTLE_PREFIX}{user_id}:{action}")
+
+
+async def release_throttle_async(user_id: int, action: str):
+    """
+    То же из бота: например, если задача так и не была поставлена.
+    """
+    await redis_client.delete(f"{THROTTLE_PREFIX}{user_id}:{action}")
+
+
+async def refund_download(user_id: int):
+    """
+    Возвращает пользователю последнюю списанную попытку скачивания (например, если задача упала).
+    """
+    await redis_client.zpopmax(f"quota:downloads:{user_id}")